@@ -0,0 +1,124 @@
+'''Benchmark command latency and waveform throughput of bkprecision against the simulator or a real oscilloscope.
+
+Usage:
+    python benchmark.py                       # in-process simulator
+    python benchmark.py --latency 0.0005      # simulator with 0.5 ms per message
+    python benchmark.py --transport socket    # simulator served on localhost, raw socket transport
+    python benchmark.py --ip 192.168.1.167    # real instrument
+Results are written as JSON to stdout (or --output FILE).
+'''
+import argparse, contextlib, json, platform, sys, time
+import numpy as np
+import bkprecision as bk
+import bkprecision_sim as sim
+
+GETTERS = [('vdiv', (1,)), ('ofst', (1,)), ('tdiv', ()), ('sara', ()), ('trmd', ()), ('acqw', ()),
+           ('wfsu', ()), ('inr', ()), ('pava', (1, 'FREQ'))]
+RECORD_LENGTHS = [1400, 14000, 140000]
+
+def connect(args):
+    '''Open the oscilloscope, keeping connection messages off the JSON output'''
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.ip is None:
+            simulator = sim.SimulatedOscilloscope(samples=max(RECORD_LENGTHS), latency=args.latency, bandwidth=args.bandwidth)
+            if args.transport == 'socket':
+                # exercise the socket transport against the simulator served on localhost
+                server = sim.serve(simulator)
+                scope = bk.Oscilloscope('127.0.0.1', pacing=args.pacing, transport='socket', port=server.server_address[1])
+            else:
+                scope = bk.Oscilloscope('simulator', pacing=args.pacing, transport=simulator)
+        else:
+            scope = bk.Oscilloscope(args.ip, pacing=args.pacing, transport=args.transport)
+    return(scope)
+
+def timings(function, repeat):
+    '''Run function repeat times and summarise the wall time of each call in seconds'''
+    samples = np.empty(repeat)
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples[index] = time.perf_counter() - start
+    return({'repeat': repeat, 'mean': float(samples.mean()), 'median': float(np.median(samples)),
+            'p95': float(np.percentile(samples, 95)), 'min': float(samples.min()), 'max': float(samples.max())})
+
+def command_latency(scope, repeat):
+    results = {}
+    for name, arguments in GETTERS:
+        method = getattr(scope, name)
+        results[name] = timings(lambda: method(*arguments), repeat)
+    return(results)
+
+def waveform_throughput(scope, repeat):
+    results = {}
+    available = int(scope.sanu(1))
+    for length in RECORD_LENGTHS:
+        if length > available:
+            continue
+        scope.wfsu(1, length, 0, 0)
+        samples = len(scope.wf(1)[1])
+        stats = timings(lambda: scope.wf(1), repeat)
+        stats['samples'] = samples
+        stats['samples_per_second'] = samples / stats['median']
+        results[str(length)] = stats
+    scope.wfsu(1, available, 0, 0)
+    return(results)
+
+def screen_dump(scope, repeat):
+    size = len(scope.scdp())
+    stats = timings(scope.scdp, repeat)
+    stats['bytes'] = size
+    stats['bytes_per_second'] = size / stats['median']
+    return(stats)
+
+def apply_setup(scope):
+    '''Full panel setup: per-channel input configuration followed by timebase and trigger'''
+    for channel in range(1, (scope.nchannels+1)):
+        scope.attn(channel, 1)
+        scope.cpl(channel, 'D1M')
+        scope.bwl(channel, 'OFF')
+        scope.vdiv(channel, '500mV')
+        scope.ofst(channel, 0.0)
+    scope.tdiv('1ms')
+    scope.trmd('AUTO')
+    scope.trsl('POS')
+
+def setup_time(scope, repeat):
+    def batched():
+        with scope.batch():
+            apply_setup(scope)
+    return({'sequential': timings(lambda: apply_setup(scope), repeat), 'batched': timings(batched, repeat)})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ip', help='instrument IP address (default: in-process simulator)')
+    parser.add_argument('--transport', default='visa', help="'visa', 'visa-socket' or 'socket' (simulator: in-process unless 'socket')")
+    parser.add_argument('--pacing', default='fixed', help="pacing policy: 'none', 'fixed' or 'adaptive'")
+    parser.add_argument('--latency', type=float, default=0.0, help='simulator latency per message in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None, help='simulator link bandwidth in bytes/s')
+    parser.add_argument('--repeat', type=int, default=20, help='repetitions per measurement')
+    parser.add_argument('--instrument', action='store_true', help='add per-command latency statistics to the results')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+    scope = connect(args)
+    if args.instrument:
+        scope.instrumentation(True)
+    try:
+        results = {'target': args.ip or 'simulator', 'transport': args.transport, 'pacing': args.pacing, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(), 'numpy': np.__version__,
+                   'command_latency': command_latency(scope, args.repeat),
+                   'waveform_throughput': waveform_throughput(scope, args.repeat),
+                   'screen_dump': screen_dump(scope, max(1, args.repeat // 4)),
+                   'setup_time': setup_time(scope, max(1, args.repeat // 4))}
+        if args.instrument:
+            results['command_stats'] = scope.command_stats()
+    finally:
+        scope.disconnect()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,561 @@
-import pyvisa, time
+import pyvisa, time, threading, collections, asyncio, functools, contextlib, socket, select, bisect, io, re, math, struct
+import concurrent.futures
+import numpy as np
+import bkprecision_units as units
+class OscilloscopeConnectionError(Exception):
+    '''Raised when the oscilloscope cannot be opened or does not complete the initialization handshake.'''
+    def __init__(self, ip, stage, cause):
+        self.ip = ip
+        self.stage = stage
+        self.cause = cause
+        Exception.__init__(self, "Couldn't connect to oscilloscope (IP {}) during {}: {}".format(ip, stage, cause))
+
+# PAVA - Parameter Value keys and their units
+PAVA_PARAMETER_UNITS={'PKPK':'V','MAX':'V','MIN':'V','AMPL':'V','TOP':'V','BASE':'V','CMEAN':'V','MEAN':'V','RMS':'V','CRMS':'V',
+                      'OVSN':'%','FPRE':'%','OVSP':'%','RPRE':'%',
+                      'FREQ':'Hz',
+                      'PER':'s','PWID':'s','NWID':'s','RISE':'s','FALL':'s','WID':'s',
+                      'DUTY':'%','NDUTY':'%'}
+
+def measure(volts, dt, params=None, bins=256):
+    '''Compute PAVA - Parameter Value measurements on the host from sampled volts (1-D capture or 2-D batch of captures)'''
+    if params is None or (type(params) is str and params.upper() == 'ALL'):
+        params=list(PAVA_PARAMETER_UNITS)
+    elif type(params) is str:
+        params=[params]
+    params=[param.upper() for param in params]
+    for param in params:
+        if param not in PAVA_PARAMETER_UNITS:
+            raise Exception("Invalid input for measure -> Use: params=['ALL' or any of {}]".format(", ".join(PAVA_PARAMETER_UNITS)))
+    volts=np.asarray(volts, dtype=float)
+    single=volts.ndim == 1
+    v=np.atleast_2d(volts)
+    if v.shape[-1] < 2:
+        raise Exception("Invalid input for measure -> Use: volts=[captures of at least 2 samples]")
+    v=v.reshape(-1,v.shape[-1])
+    rows, samples=v.shape
+    row=np.arange(rows)
+    index=np.arange(samples-1)
+    nan=np.full(rows,np.nan)
+    r={}
+    r['MAX']=v.max(axis=1)
+    r['MIN']=v.min(axis=1)
+    r['PKPK']=r['MAX']-r['MIN']
+    r['MEAN']=v.mean(axis=1)
+    r['RMS']=np.sqrt((v*v).mean(axis=1))
+    # TOP/BASE: most frequent level in the upper/lower half of a per-capture histogram
+    span=np.where(r['PKPK'] > 0, r['PKPK'], 1.0)
+    level=np.rint((v-r['MIN'][:,None])/span[:,None]*(bins-1)).astype(np.intp)
+    counts=np.bincount((level+row[:,None]*bins).ravel(), minlength=rows*bins).reshape(rows,bins)
+    half=bins//2
+    flat=r['PKPK'] == 0
+    r['BASE']=np.where(flat, r['MAX'], r['MIN']+np.argmax(counts[:,0:half],axis=1)/(bins-1)*span)
+    r['TOP']=np.where(flat, r['MAX'], r['MIN']+(half+np.argmax(counts[:,half:],axis=1))/(bins-1)*span)
+    r['AMPL']=r['TOP']-r['BASE']
+    ampl=np.where(r['AMPL'] > 0, r['AMPL'], np.nan)
+    r['OVSP']=(r['MAX']-r['TOP'])/ampl*100
+    r['OVSN']=(r['BASE']-r['MIN'])/ampl*100
+    # preshoot before a rising (falling) edge shows up below BASE (above TOP)
+    r['RPRE']=r['OVSN'].copy()
+    r['FPRE']=r['OVSP'].copy()
+    def crossings(threshold, rising):
+        '''Raw crossings of a level, marked at the sample before the crossing'''
+        above=v > threshold[:,None]
+        if rising:
+            return(~above[:,0:-1] & above[:,1:])
+        return(above[:,0:-1] & ~above[:,1:])
+    def transitions(threshold, hysteresis):
+        '''Rising and falling edges through a level, ignoring noise smaller than the hysteresis band'''
+        state=np.where(v > (threshold+hysteresis)[:,None], 1, np.where(v < (threshold-hysteresis)[:,None], 0, -1))
+        known=np.maximum.accumulate(np.where(state >= 0, np.arange(samples)[None,:], 0), axis=1)
+        state=state[row[:,None],known]
+        valid=(state[:,0:-1] >= 0) & (state[:,1:] >= 0)
+        change=state[:,1:]-state[:,0:-1]
+        return(valid & (change == 1), valid & (change == -1))
+    def first(mask, after=None):
+        if after is not None:
+            mask=mask & (index[None,:] > after[:,None])
+        return(np.where(mask.any(axis=1), np.argmax(mask,axis=1), -1))
+    def last(mask, before=None):
+        if before is not None:
+            mask=mask & (index[None,:] < before[:,None])
+        return(np.where(mask, index[None,:], -1).max(axis=1))
+    def at(position, threshold):
+        '''Interpolated crossing time (in samples) of the edge starting at position'''
+        valid=position >= 0
+        position=np.where(valid, position, 0)
+        v0=v[row,position]
+        v1=v[row,position+1]
+        step=np.where(v1 != v0, v1-v0, 1.0)
+        return(np.where(valid, position+(threshold-v0)/step, np.nan))
+    mid=(r['TOP']+r['BASE'])/2
+    band=0.1*r['AMPL']
+    mid_rise=crossings(mid,True)
+    mid_fall=crossings(mid,False)
+    rise, fall=transitions(mid,band)
+    # each hysteretic edge is timed at the last raw crossing of the level before it
+    def edge(mask, transition):
+        return(np.where(transition >= 0, last(mask,transition+1), -1))
+    rise_count=rise.sum(axis=1)
+    rise_first=first(rise)
+    rise_last=last(rise)
+    first_rise_time=at(edge(mid_rise,rise_first),mid)
+    period=np.where(rise_count >= 2, (at(edge(mid_rise,rise_last),mid)-first_rise_time)/np.maximum(rise_count-1,1), np.nan)
+    r['PER']=period*dt
+    r['FREQ']=1/r['PER']
+    fall_first=first(fall)
+    first_fall_time=at(edge(mid_fall,fall_first),mid)
+    r['PWID']=(at(edge(mid_fall,first(fall,rise_first)),mid)-first_rise_time)*dt
+    r['NWID']=(at(edge(mid_rise,first(rise,fall_first)),mid)-first_fall_time)*dt
+    r['DUTY']=r['PWID']/r['PER']*100
+    r['NDUTY']=r['NWID']/r['PER']*100
+    either=mid_rise | mid_fall
+    r['WID']=(at(edge(either,last(rise | fall)),mid)-at(edge(either,first(rise | fall)),mid))*dt
+    # RISE/FALL: 10%-90% on the first complete edge
+    low=r['BASE']+0.1*r['AMPL']
+    high=r['BASE']+0.9*r['AMPL']
+    low_rise=crossings(low,True)
+    high_rise=crossings(high,True)
+    anchor=first(rise,first(low_rise)-1)
+    r['RISE']=(at(first(high_rise,np.where(anchor >= 0, anchor-1, samples)),high)-at(edge(low_rise,anchor),low))*dt
+    high_fall=crossings(high,False)
+    low_fall=crossings(low,False)
+    anchor=first(fall,first(high_fall)-1)
+    r['FALL']=(at(first(low_fall,np.where(anchor >= 0, anchor-1, samples)),low)-at(edge(high_fall,anchor),high))*dt
+    # cycle mean/rms over the whole periods between the first and last rising edge
+    start=np.floor(np.nan_to_num(first_rise_time,nan=samples)).astype(np.intp)
+    stop=np.floor(np.nan_to_num(at(edge(mid_rise,rise_last),mid),nan=-1)).astype(np.intp)
+    cycle=(np.arange(samples)[None,:] > start[:,None]) & (np.arange(samples)[None,:] <= stop[:,None]) & (rise_count >= 2)[:,None]
+    cycle_count=cycle.sum(axis=1)
+    whole=cycle_count == 0
+    cycle_count=np.where(whole, samples, cycle_count)
+    r['CMEAN']=np.where(whole, r['MEAN'], np.where(cycle, v, 0).sum(axis=1)/cycle_count)
+    r['CRMS']=np.where(whole, r['RMS'], np.sqrt(np.where(cycle, v*v, 0).sum(axis=1)/cycle_count))
+    results={}
+    for param in params:
+        value=r[param].reshape(volts.shape[0:-1]) if not single else float(r[param][0])
+        results[param]=value
+    return(results)
+
+# TDIV-dependent limits, one row per timebase step and sorted by TDIV (s)
+# FILTS - Filter Set: lowest LOWLIMIT and highest UPPLIMIT (Hz)
+FILTS_LIMITS=[
+    # TDIV    LOWLIMIT  UPPLIMIT
+    (2.5e-09, 5.000e6, 245.0e6),
+    (5e-09,   5.000e6, 245.0e6),
+    (1e-08,   5.000e6, 245.0e6),
+    (2.5e-08, 5.000e6, 245.0e6),
+    (5e-08,   5.000e6, 245.0e6),
+    (1e-07,   5.000e6, 245.0e6),
+    (2.5e-07, 5.000e6, 245.0e6),
+    (5e-07,   2.500e6, 122.5e6),
+    (1e-06,   2.500e6, 122.5e6),
+    (2.5e-06, 1.000e6, 49.00e6),
+    (5e-06,   1.000e6, 49.00e6),
+    (1e-05,   1.000e6, 49.00e6),
+    (2.5e-05, 250.0e3, 12.25e6),
+    (5e-05,   125.0e3, 6.125e6),
+    (0.0001,  50.00e3, 2.450e6),
+    (0.00025, 25.00e3, 1.225e6),
+    (0.0005,  12.50e3, 612.5e3),
+    (0.001,   5.000e3, 245.0e3),
+    (0.0025,  2.500e3, 122.5e3),
+    (0.005,   1.250e3, 61.25e3),
+    (0.01,    500.00,  24.50e3),
+    (0.025,   250.00,  12.25e3),
+    (0.05,    125.00,  6.125e3),
+    (0.1,     250.00,  12.25e3),
+    (0.25,    100.00,  4.900e3),
+    (0.5,     50.000,  2.450e3),
+    (1.0,     25.000,  1.225e3),
+    (2.5,     10.000,  490.00),
+    (5.0,     5.0000,  245.00),
+    (10.0,    2.5000,  122.50),
+    (25.0,    1.0000,  49.000),
+    (50.0,    0.5000,  24.500)]
+# TRDL - Trigger Delay: minimum and maximum delay (s)
+TRDL_LIMITS=[
+    # TDIV    MIN           MAX
+    (2.5e-09, -4.31160e-06, 3.47550e-07),
+    (5e-09,   -7.12350e-06, 6.95100e-07),
+    (1e-08,   -1.05704e-05, 1.39020e-06),
+    (2.5e-08, -1.48945e-05, 3.47540e-06),
+    (5e-08,   -1.72459e-05, 6.95100e-06),
+    (1e-07,   -2.04799e-05, 1.39019e-05),
+    (2.5e-07, -1.97399e-05, 3.47550e-05),
+    (5e-07,   -3.94799e-05, 6.95100e-05),
+    (1e-06,   -4.09599e-05, 0.000139020),
+    (2.5e-06, -0.000102400, 0.000347550),
+    (5e-06,   -0.000102400, 0.000695100),
+    (1e-05,   -0.000102400, 0.001390200),
+    (2.5e-05, -0.000406500, 0.003475500),
+    (5e-05,   -0.000813000, 0.006951001),
+    (0.0001,  -0.002048000, 0.013902000),
+    (0.00025, -0.004065000, 0.034755000),
+    (0.0005,  -0.008130000, 0.069510000),
+    (0.001,   -0.020479990, 0.139020000),
+    (0.0025,  -0.040650000, 0.347550000),
+    (0.005,   -0.081300000, 0.695100000),
+    (0.01,    -0.204800000, 1.390200000),
+    (0.025,   -0.406500000, 3.475500000),
+    (0.05,    -0.813000000, 6.951001000),
+    (0.1,     -0.800000000, 0.800000000),
+    (0.25,    -2.000000000, 2.000000000),
+    (0.5,     -4.000000000, 4.000000000),
+    (1.0,     -8.000000000, 8.000000000),
+    (2.5,     -20.00000000, 20.00000000),
+    (5.0,     -40.00000000, 40.00000000),
+    (10.0,    -80.00000000, 80.00000000),
+    (25.0,    -200.0000000, 200.0000000),
+    (50.0,    -400.0000000, 400.0000000)]
+TDIV_STEPS=[row[0] for row in TRDL_LIMITS]
+
+def _tdiv_index(tdiv, name):
+    '''Row of the TDIV-dependent limit tables for a timebase in seconds (or a string such as '2.5ms')'''
+    if type(tdiv) is str:
+        tdiv=units.parse_value(tdiv, 's')
+    # TDIV? replies round-trip through text: match the step within a relative tolerance
+    index=bisect.bisect_left(TDIV_STEPS, tdiv*(1-1e-6))
+    if index < len(TDIV_STEPS) and TDIV_STEPS[index] <= tdiv*(1+1e-6):
+        return(index)
+    raise Exception("Invalid input for {} -> Use: tdiv=[2.5ns~50s in 1-2.5-5 steps]".format(name))
+
+def filter_range(tdiv):
+    '''FILTS - Filter Set limits (lowest LOWLIMIT, highest UPPLIMIT) in Hz at a given timebase'''
+    return(FILTS_LIMITS[_tdiv_index(tdiv, 'filter_range')][1:])
+
+def trigger_delay_range(tdiv):
+    '''TRDL - Trigger Delay limits (min, max) in seconds at a given timebase'''
+    return(TRDL_LIMITS[_tdiv_index(tdiv, 'trigger_delay_range')][1:])
+
+class Waveform(object):
+    '''A captured waveform kept as raw int8 samples plus the scale settings; volts and time are computed on demand.'''
+    __slots__ = ('raw', 'vdiv', 'offset', 'tdiv', 'sara', 'channel', 'timestamp', 'first', 'sparsing')
+    def __init__(self, raw, vdiv, offset, tdiv, sara, channel=None, timestamp=None, first=0, sparsing=1):
+        self.raw = raw
+        self.vdiv = vdiv
+        self.offset = offset
+        self.tdiv = tdiv
+        self.sara = sara
+        self.channel = channel
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # WFSU first point and sparsing interval the samples were transferred with
+        self.first = first
+        self.sparsing = sparsing
+
+    @property
+    def volts(self):
+        '''Samples in volts'''
+        return(self.scale())
+
+    def scale(self, out=None):
+        '''Samples in volts, optionally written into a preallocated float array'''
+        out=np.multiply(self.raw, self.vdiv / 25, out=out)
+        out-=self.offset
+        return(out)
+
+    @property
+    def t0(self):
+        '''Time of the first sample relative to the trigger'''
+        return(-(self.tdiv * 14 / 2) + self.first / self.sara)
+
+    @property
+    def dt(self):
+        '''Time between samples'''
+        return(self.sparsing / self.sara)
+
+    @property
+    def time(self):
+        '''Time axis in seconds'''
+        return(self.t0 + np.arange(len(self.raw)) * self.dt)
+
+    def measure(self, params=None):
+        '''Compute PAVA - Parameter Value measurements on the host from this capture'''
+        return(measure(self.volts, self.dt, params))
+
+    def __len__(self):
+        return(len(self.raw))
+
+    def __iter__(self):
+        # unpacks like the (time_value, volt_value) tuple returned by wf()
+        return(iter((self.time, self.volts)))
+
+    def __repr__(self):
+        return("Waveform(channel={}, samples={}, vdiv={}, offset={}, tdiv={}, sara={})".format(self.channel, len(self.raw), self.vdiv, self.offset, self.tdiv, self.sara))
+
+class GcsvReader(object):
+    '''Incremental parser for GCSV - Get CSV replies: feed() raw bytes as they arrive, numeric rows go straight into a float array.'''
+    def __init__(self):
+        self.header = {}
+        self.names = None
+        self.length = None
+        self.rows = 0
+        self.ended = False
+        self.__pending = b''
+        self.__label = None
+        self.__data = None
+        self.__blocks = []
+
+    @property
+    def done(self):
+        '''True once the number of rows announced by the Record Length header has been parsed, or a blank line has ended the rows'''
+        return(self.ended or (self.length is not None and self.rows >= self.length))
+
+    def feed(self, data):
+        '''Parse the complete lines in data, keeping a trailing partial line for the next call'''
+        if self.ended:
+            return
+        data=self.__pending+bytes(data)
+        cut=data.rfind(b'\n')+1
+        self.__pending=data[cut:]
+        lines=data[0:cut]
+        if self.names is None:
+            lines=self.__feed_header(lines)
+        if lines and self.names is not None:
+            self.__feed_rows(lines)
+
+    def close(self):
+        '''Parse a last line left without a line terminator'''
+        pending, self.__pending=self.__pending, b''
+        if pending.strip():
+            self.feed(pending+b'\n')
+
+    def __feed_header(self, lines):
+        '''Consume metadata lines up to the column names line, returning the remaining (numeric) lines'''
+        start=0
+        while start < len(lines):
+            end=lines.index(b'\n', start)+1
+            line=lines[start:end].strip()
+            if line:
+                fields=line.decode('ascii').split(',')
+                if not GcsvReader.__NUMBER.match(fields[0]):
+                    if self.__label is not None:
+                        self.__add_header(self.__label)
+                    self.__label=fields
+                else:
+                    # the last non-numeric line before the first row names the columns
+                    self.names=[name.strip() for name in self.__label]
+                    self.__allocate()
+                    return(lines[start:])
+            start=end
+        return(b'')
+
+    def __add_header(self, fields):
+        key=fields[0].strip()
+        values=[GcsvReader.__typed(value.strip()) for value in fields[1:]]
+        self.header[key]=values[0] if len(values) == 1 else values
+        if key.upper() == 'RECORD LENGTH':
+            count=re.search(r'(\d+)', ",".join(fields[1:]))
+            if count is not None:
+                self.length=int(count.group(1))
+
+    def __allocate(self):
+        if self.length is not None:
+            # column-major so every column is a contiguous array
+            self.__data=np.empty((self.length,len(self.names)), order='F')
+
+    def __feed_rows(self, lines):
+        blank=GcsvReader.__BLANK.search(lines)
+        if blank is not None:
+            # a blank line after the rows terminates the reply
+            self.ended=True
+            lines=lines[0:blank.start()]
+            if not lines.strip():
+                return
+        block=np.loadtxt(io.BytesIO(lines), delimiter=',', ndmin=2, usecols=range(len(self.names)))
+        if self.__data is not None and self.rows+len(block) <= self.length:
+            self.__data[self.rows:self.rows+len(block)]=block
+        else:
+            if self.__data is not None:
+                self.__blocks.append(self.__data[0:self.rows])
+                self.__data=None
+            self.__blocks.append(block)
+        self.rows+=len(block)
+
+    def columns(self):
+        '''Parsed columns as {name: 1-D float array}'''
+        if self.names is None:
+            return({})
+        if self.__data is not None:
+            data=self.__data[0:self.rows]
+        elif self.__blocks:
+            data=np.asfortranarray(np.concatenate(self.__blocks))
+        else:
+            data=np.empty((0,len(self.names)))
+        return({name: data[:,index] for index,name in enumerate(self.names)})
+
+    @staticmethod
+    def __typed(value):
+        for cast in (int, float):
+            try:
+                return(cast(value))
+            except ValueError:
+                pass
+        return(value)
+
+    __NUMBER=re.compile(r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$')
+    __BLANK=re.compile(rb'^[ \t\r]*\n', re.M)
+
+def bmp_to_array(data):
+    '''Decode an uncompressed BMP (1, 4 or 8-bit palette, 16, 24 or 32-bit) into a (height, width, 3) RGB uint8 array'''
+    data=bytes(data)
+    if data[0:2] != b'BM':
+        raise Exception("Error. Screen dump is not a BMP image.")
+    offset=int.from_bytes(data[10:14],'little')
+    info=int.from_bytes(data[14:18],'little')
+    width=int.from_bytes(data[18:22],'little',signed=True)
+    height=int.from_bytes(data[22:26],'little',signed=True)
+    bits=int.from_bytes(data[28:30],'little')
+    compression=int.from_bytes(data[30:34],'little')
+    if info < 40 or compression not in (0,3) or bits not in (1,4,8,16,24,32):
+        raise Exception("Error. Unsupported BMP format ({}-bit, compression {}).".format(bits,compression))
+    rows=abs(height)
+    # rows are padded to 4 bytes
+    stride=(width*bits+31)//32*4
+    pixels=np.frombuffer(data,np.uint8,stride*rows,offset).reshape(rows,stride)
+    if bits == 24:
+        rgb=pixels[:,0:width*3].reshape(rows,width,3)[:,:,::-1]
+    elif bits in (16,32):
+        words=pixels[:,0:width*bits//8].view('<u{}'.format(bits//8))
+        if compression == 3:
+            masks=[int.from_bytes(data[position:position+4],'little') for position in (54,58,62)]
+        elif bits == 16:
+            masks=[0x7C00,0x03E0,0x001F]
+        else:
+            masks=[0xFF0000,0x00FF00,0x0000FF]
+        rgb=np.empty((rows,width,3),np.uint8)
+        for index,mask in enumerate(masks):
+            shift=(mask & -mask).bit_length()-1
+            rgb[:,:,index]=((words & mask) >> shift).astype(np.uint32)*255//max(1,mask >> shift)
+    else:
+        colours=int.from_bytes(data[46:50],'little') or 2**bits
+        palette=np.frombuffer(data,np.uint8,colours*4,14+info).reshape(colours,4)[:,2::-1]
+        if bits == 8:
+            indices=pixels[:,0:width]
+        elif bits == 4:
+            indices=np.stack((pixels >> 4, pixels & 0x0F),axis=2).reshape(rows,-1)[:,0:width]
+        else:
+            indices=np.unpackbits(pixels,axis=1)[:,0:width]
+        rgb=palette[indices]
+    if height > 0:
+        # positive height: rows are stored bottom-up
+        rgb=rgb[::-1]
+    return(np.ascontiguousarray(rgb))
+
 class Oscilloscope(object):
     '''A class for simplifying communication with BK Precision oscilloscopes.'''
-    def __init__(self, ip):
+    def __init__(self, ip, pacing='fixed', transport='visa', port=5025, lazy=False, structured=False):
+        # one transaction (a command and the reads of its reply) at a time on the resource, see LockedResource
+        self.__lock = threading.RLock()
+        # batch() diverts only the calling thread's commands
+        self.__local = threading.local()
         self.delay = 0.001
-        rm = pyvisa.ResourceManager()
-        try:
+        # ADAPTIVE pacing: moving average of the measured settle time, and when the unsynced settings change was written
+        self.response_time = None
+        self.__unsettled = None
+        self.pacing(pacing)
+        self.cache = True
+        # getters return typed dicts/values instead of "KEY=value" strings
+        self.structured = structured
+        self.__settings = {}
+        # (time, state) of the last screen dump taken by scdp_changed
+        self.__screen = None
+        # CommandStats while instrumentation is enabled
+        self.__stats = None
+        # trace file while recording
+        self.__trace = None
+        if type(transport) is str and transport.lower() not in ('visa','visa-socket','socket'):
+            raise Exception("Invalid input for transport -> Use: transport=['visa', 'visa-socket', 'socket' or an open pyvisa-like resource]")
+        self.ip = ip
+        self.port = port
+        self.transport = transport
+        self.nchannels = 2
+        self.__osc = None
+        # a resource passed as transport that disconnect() has closed: it cannot be reopened
+        self.__closed = None
+        if not lazy:
             print("Connecting to oscilloscope (IP {}).".format(ip))
-            self.osc = rm.open_resource("TCPIP::{}::INSTR".format(ip),read_termination='\n')
-            self.osc.chunk_size=20480
-            self.osc.timeout=5000
-            self.nchannels=2
-            print(self.chdr('off'))
-            print(self.wfsu(1,int(self.sanu(1)),0,0))
+            self.connect()
             print("Connected!!!")
-            return
-        except:
-            print("Couldn't connect to oscilloscope.")
-        
+
+    @property
+    def osc(self):
+        '''Instrument resource (the open batch of this thread, if any), connecting on first use'''
+        batch = getattr(self.__local, 'batch', None)
+        if batch is not None:
+            return(batch)
+        if self.__osc is None:
+            self.connect()
+        return(self.__osc)
+
+    @osc.setter
+    def osc(self, resource):
+        self.__osc = resource
+
+    def connect(self):
+        '''Open the resource and run the initialization handshake in one batched exchange'''
+        if self.__osc is not None:
+            return("Success. Already connected to oscilloscope (IP {}).".format(self.ip))
+        try:
+            if self.transport is self.__closed:
+                raise Exception("Error. The transport resource was closed by disconnect() -> Use: transport=[a new open resource]")
+            if type(self.transport) is not str:
+                resource = self.transport
+            elif self.transport.lower() == 'socket':
+                resource = SocketResource(self.ip, self.port)
+            elif self.transport.lower() == 'visa-socket':
+                rm = pyvisa.ResourceManager()
+                resource = rm.open_resource("TCPIP::{}::{}::SOCKET".format(self.ip,self.port),read_termination='\n',write_termination='\n')
+            else:
+                rm = pyvisa.ResourceManager()
+                resource = rm.open_resource("TCPIP::{}::INSTR".format(self.ip),read_termination='\n')
+            resource.chunk_size=20480
+            resource.timeout=5000
+            if self.__trace is not None:
+                resource = TraceRecorder(resource, self.__trace)
+            if self.__stats is not None:
+                resource = InstrumentedResource(resource, self.__stats)
+            resource = LockedResource(resource, self.__lock)
+        except Exception as error:
+            raise OscilloscopeConnectionError(self.ip, 'open', error)
+        self.__osc = resource
+        # settings cached from an earlier session may have changed on the instrument meanwhile
+        self.__invalidate()
+        try:
+            # CHDR OFF rides along with the SANU? query, WFSU goes out when the batch closes
+            with self.batch():
+                self.chdr('off')
+                self.osc.write("WFSU SP,1,NP,{},FP,0,SN,0".format(int(self.sanu(1))))
+        except Exception as error:
+            self.__remove_proxy(TraceRecorder)
+            self.__osc = None
+            try:
+                resource.close()
+            except Exception:
+                pass
+            if type(self.transport) is not str:
+                self.__closed = self.transport
+            raise OscilloscopeConnectionError(self.ip, 'handshake', error)
+        return("Success. Connected to oscilloscope (IP {}).".format(self.ip))
+
     def disconnect(self):
         """Close the resource manager connection."""
-        self.osc.close()
+        if self.__osc is not None:
+            # close the trace file but keep the path: recording resumes on the next connect()
+            self.__remove_proxy(TraceRecorder)
+            self.__osc.close()
+            self.__osc = None
+            if type(self.transport) is not str:
+                self.__closed = self.transport
+        self.__invalidate()
         return("Connection finished.")
 
     # ACQUIRE_WAY
     def __acqw_get(self):
         '''Get configuration of ACQW - Acquire Way'''
         query_results = self.osc.query("ACQW?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def acqw(self, mode=None, times=None):
         '''Set configuration to ACQW - Acquire Way'''
         if mode is None:
@@ -38,11 +566,13 @@ class Oscilloscope(object):
                     if mode.upper() == 'AVERAGE':
                         if times in (4, 16, 32, 64, 128, 256):
                             self.osc.write("AVGA {}".format(times))
+                            self.__invalidate('SARA')
                             return("Success. Acquire Way set to {} with {} averages.".format(mode.upper(),times))
                         else:
                             raise Exception
                     else:
                         self.osc.write("ACQW {}".format(mode.upper()))
+                        self.__invalidate('SARA')
                         return("Success. Acquire Way set to {}.".format(mode.upper()))
                 else:
                     raise Exception
@@ -53,8 +583,8 @@ class Oscilloscope(object):
     def alst(self):
         '''Get configuration of ALST? - All Status'''
         query_results = self.osc.query("ALST?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
 
     # ARM_ACQUISITION
     def arm(self):
@@ -68,8 +598,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:ATTN?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -78,16 +608,14 @@ class Oscilloscope(object):
         '''Set configuration to ATTN - Attenuation'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__attn_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__attn_get))
             else:
                 return self.__attn_get(channel)
         else:
             try:
                 if channel in (range(1,(self.nchannels+1))) and value in(1,5,10,50,100,500,1000):
                     self.osc.write("C{}:ATTN {}".format(channel,value))
+                    self.__invalidate(('VDIV',channel),('OFST',channel))
                     return("Success. Attenuation set to {}x on channel {}.".format(value,channel))
                 else:
                     raise Exception
@@ -97,14 +625,15 @@ class Oscilloscope(object):
     # AUTO_SETUP
     def aset(self):
         '''Command ASET - Auto Setup'''
+        self.__invalidate()
         return(self.osc.write("ASET"))
 
     # AUTO_TYPESET
     def __autts_get(self):
         '''Get configuration of AUTTS - Auto Typeset'''
         query_results = self.osc.query("AUTTS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def autts(self, value=None):
         '''Set configuration to AUTTS - Auto Typeset'''
         if value is None:
@@ -113,6 +642,7 @@ class Oscilloscope(object):
             try:
                 if value.upper() in ('SP','MP','RS','DRP','RC'):
                     self.osc.write("AUTTS {}".format(value))
+                    self.__invalidate()
                     return("Success. Auto Typeset set to {}.".format(value.upper()))
                 else:
                     raise Exception
@@ -128,8 +658,8 @@ class Oscilloscope(object):
     def __avga_get(self):
         '''Get configuration of AVGA - Average Acquire'''
         query_results = self.osc.query("AVGA?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def avga(self, value=None):
         '''Set configuration to AVGA - Average Acquire'''
         if value is None:
@@ -138,6 +668,7 @@ class Oscilloscope(object):
             try:
                 if value in (4, 16, 32, 64, 128, 256):
                     self.osc.write("AVGA {}".format(value))
+                    self.__invalidate('SARA')
                     return("Success. Average Acquire set to {}.".format(value))
                 else:
                     raise Exception
@@ -151,8 +682,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:BWL?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -161,10 +692,7 @@ class Oscilloscope(object):
         '''Set configuration to BWL - BandWidth Limit'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__bwl_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__bwl_get))
             else:
                 return self.__bwl_get(channel)
         else:
@@ -181,8 +709,8 @@ class Oscilloscope(object):
     def __buzz_get(self):
         '''Get configuration of BUZZ - Buzzer'''
         query_results = self.osc.query("BUZZ?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def buzz(self, value=None):
         '''Set configuration to BUZZ - Buzzer'''
         if value is None:
@@ -223,8 +751,8 @@ class Oscilloscope(object):
         '''Query CMR? - Command Error Register'''
         try:
             query_results=self.osc.query("CMR?")
-            time.sleep(self.delay)
-            return(Oscilloscope.format_results(query_results))
+            self.__pace()
+            return(self.__results(query_results))
         except:
             raise Exception("Error. Command Error Register not performed.")
 
@@ -232,8 +760,8 @@ class Oscilloscope(object):
     def __chdr_get(self):
         '''Get configuration of CHDR - Comm Header'''
         query_results = self.osc.query("CHDR?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def chdr(self, value=None):
         '''Set configuration to CHDR - Comm Header'''
         if value is None:
@@ -256,7 +784,7 @@ class Oscilloscope(object):
         '''Query CONET? - Commom Net'''
         try:
             query_results=self.osc.query("CONET?")
-            time.sleep(self.delay)
+            self.__pace()
             return(query_results.replace(',','.'))
         except:
             raise Exception("Failed. Commom Net query not performed.")
@@ -265,8 +793,8 @@ class Oscilloscope(object):
     def __coun_get(self):
         '''Get configuration of COUN - Cymometer Display'''
         query_results = self.osc.query("COUN?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def coun(self, value=None):
         '''Set configuration to COUN - Cymometer Display'''
         if value is None:
@@ -288,8 +816,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{0}:CPL?".format(str(channel)))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -298,10 +826,7 @@ class Oscilloscope(object):
         '''Set configuration to CPL - Coupling'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__cpl_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__cpl_get))
             else:
                 return self.__cpl_get(channel)
         else:
@@ -318,8 +843,8 @@ class Oscilloscope(object):
     def __csvs_get(self):
         '''Get configuration of CSVS - CSV Save'''
         query_results = self.osc.query("CSVS?")
-        time.sleep(self.delay)
-        return Oscilloscope.format_results(query_results)
+        self.__pace()
+        return(self.__results(query_results))
     def csvs(self, dd=None, save=None):
         '''Set configuration to CSVS - CSV Save'''
         nones=0
@@ -357,8 +882,8 @@ class Oscilloscope(object):
     def __crms_get(self):
         '''Get configuration of CRMS - Cursor Measure'''
         query_results = self.osc.query("CRMS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def crms(self, value=None):
         '''Set configuration to CRMS - Cursor Measure'''
         if value is None:
@@ -383,7 +908,7 @@ class Oscilloscope(object):
             if channel is not None:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{0}:CRST? VREF, VDIF, TREF, TDIF, HREF, HDIF".format(str(channel)))
-                    time.sleep(self.delay)
+                    self.__pace()
                     return "C{0}={1}".format(channel,Oscilloscope.format_results(query_results))
                 else:
                     raise Exception
@@ -457,7 +982,7 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:CRVA? {}".format(channel,value))
-                    time.sleep(self.delay)
+                    self.__pace()
                     return "C{}={}".format(channel,query_results)
                 else:
                     raise Exception
@@ -489,21 +1014,21 @@ class Oscilloscope(object):
     def cymt(self):
         '''Query CYMT - Cymometer'''
         query_results = self.osc.query("CYMT?")
-        time.sleep(self.delay)
-        return Oscilloscope.format_results(query_results)
+        self.__pace()
+        return(self.__results(query_results))
             
     # DDR?
     def ddr(self):
         '''Query DDR? - Device Dependent Register'''
         query_results = self.osc.query("DDR?")
-        time.sleep(self.delay)
-        return Oscilloscope.format_results(query_results)
+        self.__pace()
+        return(self.__results(query_results))
 
     # DEFINE
     def __defm_get(self):
         '''Get configuration of DEF - Mathematical Expression'''
         query_results = self.osc.query("DEF?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
     def defm(self, oper=None, sourceA=None, sourceB=None):
         '''Set configuration to DEF - Mathematical Expression'''
@@ -540,9 +1065,10 @@ class Oscilloscope(object):
         if path is None:
             return(self.osc.query("DIR? DISK,UDSK"))
         if path.upper().find('/') != -1:
-            self.osc.write("DIR? DISK,UDSK,'{}'".format(path.upper()))
-            query_results=self.osc.read_raw()
-            time.sleep(self.delay)
+            with self.__lock:
+                self.osc.write("DIR? DISK,UDSK,'{}'".format(path.upper()))
+                query_results=self.osc.read_raw()
+            self.__pace()
             if query_results==b'':
                 raise Exception("Directory {} not found".format(path))
             else:
@@ -576,8 +1102,8 @@ class Oscilloscope(object):
     def __dtjn_get(self):
         '''Get configuration of DTJN - Dot Join'''
         query_results = self.osc.query("DTJN?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def dtjn(self, value=None):
         '''Set configuration to DTJN - Dot Join'''
         if value is None:
@@ -596,8 +1122,8 @@ class Oscilloscope(object):
     def __ese_get(self):
         '''Query from *ESE Command'''
         query_results = self.osc.query("*ESE?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def _ese(self, value=None):
         '''Command for *ESE Command'''
         if value is None:
@@ -616,22 +1142,22 @@ class Oscilloscope(object):
     def _esr(self):
         '''Query from *ESR Command'''
         query_results = self.osc.query("*ESR?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
 
     # EXR?
     def exr(self):
         '''Query from EXR? Command'''
         query_results = self.osc.query("EXR?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
 
     # FFT_FULLSCREEN
     def __fftf_get(self):
         '''Get configuration of FFTF - FFT Fullscreen'''
         query_results = self.osc.query("FFTF?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def fftf(self, value=None):
         '''Set configuration to FFTF - FFT Fullscreen'''
         if value is None:
@@ -653,8 +1179,8 @@ class Oscilloscope(object):
     def __ffts_get(self):
         '''Get configuration of FFTS - FFT Scale'''
         query_results = self.osc.query("FFTS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def ffts(self, value=None):
         '''Set configuration to FFTS - FFT Scale'''
         if value is None:
@@ -676,8 +1202,8 @@ class Oscilloscope(object):
     def __fftw_get(self):
         '''Get configuration of FFTW - FFT Window'''
         query_results = self.osc.query("FFTW?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def fftw(self, value=None):
         '''Set configuration to FFTW - FFT Window'''
         if value is None:
@@ -699,8 +1225,8 @@ class Oscilloscope(object):
     def __fftz_get(self):
         '''Get configuration of FFTZ - FFT Zoom'''
         query_results = self.osc.query("FFTZ?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def fftz(self, value=None):
         '''Set configuration to FFTZ - FFT Zoom'''
         if value is None:
@@ -722,8 +1248,8 @@ class Oscilloscope(object):
     def __flnm_get(self, ftype=None):
         '''Get configuration of FLNM - File Name'''
         query_results = self.osc.query("FLNM? TYPE,{}".format(ftype.upper()))
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def flnm(self, ftype=None, fname=None):
         '''Set configuration to FLNM - File Name'''
         ftype_avalible=['C1','C2','TA','TB','SETUP','HCOPY']
@@ -758,7 +1284,7 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:FILTS?".format(channel))
-                    time.sleep(self.delay)
+                    self.__pace()
                     return(query_results)
                 else:
                     raise Exception
@@ -768,19 +1294,11 @@ class Oscilloscope(object):
         '''Set configuration to FILTS - Filter Set'''
         if ftype is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__filts_get(set_channel)))
-                return(channel_list)
+                return(self.__per_channel(self.__filts_get))
             else:
                 return(self.__filts_get(channel))
         else:
-            tdiv=self.tdiv(True)
-            for freq in self.__filts_limits():
-                if freq[0].find(tdiv)==0:
-                    upplimitmax=self.__indiscret_convert(self.__std(freq[2]),'HZ')
-                    lowlimitmin=self.__indiscret_convert(self.__std(freq[3]),'HZ')
-                    break
+            lowlimitmin,upplimitmax=filter_range(self.__cached('TDIV',self.tdiv))
             upplimitmaxdisconv=self.__discret_convert(upplimitmax,'Hz',3)
             lowlimitmindisconv=self.__discret_convert(lowlimitmin,'Hz',3)
             if ftype.upper() in ('LP','HP','BP','BR'):
@@ -856,42 +1374,6 @@ class Oscilloscope(object):
                                 ".format(str(self.nchannels)))
             self.tdiv(self.tdiv())
             return message_success
-    def __filts_limits(self):
-        return(\
-        # TDIV     TDIV float  UPPLIMIT   LOWLIMIT
-        [['2.50ns', '2.5e-09', '245.0MHz', '5.000MHz'],\
-        ['5ns'    , '5e-09'  , '245.0MHz', '5.000MHz'],\
-        ['10ns'   , '1e-08'  , '245.0MHz', '5.000MHz'],\
-        ['25ns'   , '2.5e-08', '245.0MHz', '5.000MHz'],\
-        ['50ns'   , '5e-08'  , '245.0MHz', '5.000MHz'],\
-        ['100ns'  , '1e-07'  , '245.0MHz', '5.000MHz'],\
-        ['250ns'  , '2.5e-07', '245.0MHz', '5.000MHz'],\
-        ['500ns'  , '5e-07'  , '122.5MHz', '2.500MHz'],\
-        ['1us'    , '1e-06'  , '122.5MHz', '2.500MHz'],\
-        ['2.50us' , '2.5e-06', '49.00MHz', '1.000MHz'],\
-        ['5us'    , '5e-06'  , '49.00MHz', '1.000MHz'],\
-        ['10us'   , '1e-05'  , '49.00MHz', '1.000MHz'],\
-        ['25us'   , '2.5e-05', '12.25MHz', '250.0KHz'],\
-        ['50us'   , '5e-05'  , '6.125MHz', '125.0KHz'],\
-        ['100us'  , '0.0001' , '2.450MHz', '50.00KHz'],\
-        ['250us'  , '0.00025', '1.225MHz', '25.00KHz'],\
-        ['500us'  , '0.0005' , '612.5KHz', '12.50KHz'],\
-        ['1ms'    , '0.001'  , '245.0KHz', '5.000KHz'],\
-        ['2.50ms' , '0.0025' , '122.5KHz', '2.500KHz'],\
-        ['5ms'    , '0.005'  , '61.25KHz', '1.250KHz'],\
-        ['10ms'   , '0.01'   , '24.50KHz', '500.00Hz'],\
-        ['25ms'   , '0.025'  , '12.25KHz', '250.00Hz'],\
-        ['50ms'   , '0.05'   , '6.125KHz', '125.00Hz'],\
-        ['100ms'  , '0.1'    , '12.25KHz', '250.00Hz'],\
-        ['250ms'  , '0.25'   , '4.900KHz', '100.00Hz'],\
-        ['500ms'  , '0.5'    , '2.450KHz', '50.000Hz'],\
-        ['1s'     , '1.0'    , '1.225KHz', '25.000Hz'],\
-        ['2.50s'  , '2.5'    , '490.00Hz', '10.000Hz'],\
-        ['5s'     , '5.0'    , '245.00Hz', '5.0000Hz'],\
-        ['10s'    , '10.0'   , '122.50Hz', '2.5000Hz'],\
-        ['25s'    , '25.0'   , '49.000Hz', '1.0000Hz'],\
-        ['50s'    , '50.0'   , '24.500Hz', '0.5000Hz']])
-
     # FILTER
     def __filt_get(self, channel=None):
         '''Get configuration of FILT - Filter'''
@@ -899,8 +1381,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:FILT?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -909,10 +1391,7 @@ class Oscilloscope(object):
         '''Set configuration to FILT - Filter'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__filt_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__filt_get))
             else:
                 return self.__filt_get(channel)
         else:
@@ -959,13 +1438,33 @@ class Oscilloscope(object):
             return(csv_data)
         except:
             raise Exception("Error. Failed to Get CSV.")
+    def gcsv_arrays(self, dd='DIS', save='OFF', chunk_size=1024*1024):
+        '''Query GCSV - Get CSV and parse it while it arrives: returns (header, {column: float array})'''
+        if dd.upper() not in  ('DIS','MAX'):
+            raise Exception("Invalid input for Get CSV. Use: dd=['DIS' or 'MAX]")
+        if save.upper() not in  ('ON','OFF'):
+            raise Exception("Invalid input for Get CSV. Use: save=['ON' or 'OFF]")
+        reader=GcsvReader()
+        try:
+            with self.__lock:
+                self.__settle()
+                self.osc.write("GCSV? DD,{},SAVE,{}".format(dd.upper(),save.upper()))
+                with contextlib.closing(self.__reply_chunks(chunk_size)) as chunks:
+                    for chunk, end in chunks:
+                        reader.feed(chunk)
+                        if end or reader.done:
+                            break
+            reader.close()
+        except Exception as e:
+            raise Exception("Error. Failed to Get CSV: {}".format(e))
+        return(reader.header, reader.columns())
 
     # GRID_DISPLAY
     def __grds_get(self):
         '''Get configuration of GRDS - Grid Display'''
         query_results = self.osc.query("GRDS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def grds(self, value=None):
         '''Set configuration to GRDS - Grid Display'''
         if value is None:
@@ -984,22 +1483,22 @@ class Oscilloscope(object):
     def _idn(self):
         '''Query *IDN? - Identification'''
         query_results = self.osc.query("*IDN?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results.split(','))
 
     # INR?
     def inr(self):
         '''Query INR? - Internal Register'''
         query_results = self.osc.query("INR?")
-        time.sleep(self.delay)
+        self.__pace()
         return(int(query_results))
 
     # INTENSITY
     def __ints_get(self):
         '''Get configuration of INTS - Intensity Trace and Grid'''
         query_results = self.osc.query("INTS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def ints(self, trace=None, grid=None):
         '''Set configuration to INTS - Intensity Trace and Grid'''
         if trace is None and grid is None:
@@ -1018,8 +1517,8 @@ class Oscilloscope(object):
     def __ilvd_get(self):
         '''Get configuration of ILVD - Interleaved'''
         query_results = self.osc.query("ILVD?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def ilvd(self, value=None):
         '''Set configuration to ILVD - Interleaved'''
         if value is None:
@@ -1028,6 +1527,7 @@ class Oscilloscope(object):
             try:
                 if value.upper() in ('ON','OFF'):
                     self.osc.write("ILVD {}".format(value.upper()))
+                    self.__invalidate('SARA')
                     return("Success. Interleaved set to {}.".format(value.upper()))
                 else:
                     raise Exception
@@ -1041,8 +1541,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:INVS?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -1051,10 +1551,7 @@ class Oscilloscope(object):
         '''Set configuration to INVS - Invert Set'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__invs_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__invs_get))
             else:
                 return self.__invs_get(channel)
         else:
@@ -1071,8 +1568,8 @@ class Oscilloscope(object):
     def __lock_get(self):
         '''Get configuration of LOCK - Lock Keyboard'''
         query_results = self.osc.query("LOCK?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def lock(self, value=None):
         '''Set configuration to LOCK - Lock Keyboard'''
         if value is None:
@@ -1094,8 +1591,8 @@ class Oscilloscope(object):
     def __mtvd_get(self):
         '''Get configuration of MTVD - Mathematical Verical Division'''
         query_results = self.osc.query("MTVD?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def mtvd(self, value=None):
         '''Set configuration to MTVD - Mathematical Verical Division'''
         if value is None:
@@ -1118,8 +1615,8 @@ class Oscilloscope(object):
     def __mtvp_get(self):
         '''Get configuration of MTVP - Mathematical Verical Position'''
         query_results = self.osc.query("MTVP?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def mtvp(self, value=None):
         '''Set configuration to MTVP - Mathematical Verical Position'''
         if value is None:
@@ -1159,8 +1656,8 @@ class Oscilloscope(object):
     def __menu_get(self):
         '''Get configuration of MENU - Menu Display'''
         query_results = self.osc.query("MENU?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def menu(self, value=None):
         '''Set configuration to MENU - Menu Display'''
         if value is None:
@@ -1169,7 +1666,7 @@ class Oscilloscope(object):
             try:
                 if value.upper() in ('ON','OFF'):
                     self.osc.write("MENU {}".format(value.upper()))
-                    time.sleep(0.1)
+                    self.__pace(0.1, sync=True)
                     return("Success. Menu Display set to {}.".format(value.upper()))
                 else:
                     raise Exception
@@ -1183,7 +1680,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:OFST?".format(channel))
-                    time.sleep(self.delay)
+                    self.__pace()
+                    self.__settings[('OFST',channel)] = float(query_results)
                     return float(query_results)
                 else:
                     raise Exception
@@ -1193,10 +1691,7 @@ class Oscilloscope(object):
         '''Set value of OFST - Offset'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__ofst_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__ofst_get))
             else:
                 return self.__ofst_get(channel)
         else:
@@ -1213,6 +1708,7 @@ class Oscilloscope(object):
                         value=self.__indiscret_convert(self.__std(value),'v')    
                     if value >= offset_max_neg and value <= offset_max_pos:
                         self.osc.write("C{}:OFST {}".format(channel,value))
+                        self.__invalidate(('OFST',channel))
                         return("Success. Offset set to {} on channel {}.".format(value,channel))
                     else:
                         raise Exception
@@ -1225,8 +1721,8 @@ class Oscilloscope(object):
     def __opc_get(self):
         '''Query from *OPC - Operation Complete'''
         query_results = self.osc.query("*OPC?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def _opc(self, value=None):
         '''Command for *OPC - Operation Complete'''
         if value is None:
@@ -1245,7 +1741,7 @@ class Oscilloscope(object):
     def _opt(self):
         '''Query from *OPT? Query'''
         query_results = self.osc.query("*OPT?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
 
     # PANEL_SETUP
@@ -1255,8 +1751,9 @@ class Oscilloscope(object):
             if type(file) is str and str(file).upper().find('.SET') != -1:
                 if action is not None:
                     if action.upper() == "SAVE":
-                        self.osc.write("PNSU?")
-                        data=self.osc.read_raw()
+                        with self.__lock:
+                            self.osc.write("PNSU?")
+                            data=self.osc.read_raw()
                         try:
                             with open(file.upper(),'wb') as f:
                                 f.write(data)
@@ -1269,6 +1766,7 @@ class Oscilloscope(object):
                             with open(file.upper(),'rb') as f:
                                 data=f.read()
                             self.osc.write_raw(pnsu+data)
+                            self.__invalidate()
                             self.run()
                             return("Success. Panel Setup Command recall from file: {}.".format(file.upper()))
                         except:
@@ -1297,10 +1795,13 @@ class Oscilloscope(object):
         if channel is not None:
             try:
                 if channel in (range(1,(self.nchannels+1))):
+                    self.__settle()
                     query_results = self.osc.query("C{}:PAVA? {}".format(channel,param))
-                    time.sleep(0.02)
+                    self.__pace(0.02)
                     if param.upper() == 'ALL':
-                        return(Oscilloscope.format_results(query_results))
+                        # values stay as the instrument sent them: typed only for structured results
+                        fields=query_results.split(',')
+                        return({str(key).upper(): value for key,value in zip(fields[0::2],fields[1::2])})
                     else:
                         return(query_results.split(',')[1])
                 else:
@@ -1309,52 +1810,41 @@ class Oscilloscope(object):
                 raise Exception("Invalid input for PAVA - Parameter Value -> Use: channel=[1~{0}]".format(str(self.nchannels)))
     def __pava_param_units(self, param):
         '''Units of parameter to PAVA - Parameter Value'''
-        parameter_units={'PKPK':'V','MAX':'V','MIN':'V','AMPL':'V','TOP':'V','BASE':'V','CMEAN':'V','MEAN':'V','RMS':'V','CRMS':'V',
-                         'OVSN':'%','FPRE':'%','OVSP':'%','RPRE':'%',
-                         'FREQ':'Hz',
-                         'PER':'s','PWID':'s','NWID':'s','RISE':'s','FALL':'s','WID':'s',
-                         'DUTY':'%','NDUTY':'%'}
-        for par in parameter_units.keys():
-            if param.upper() == par:
-                return parameter_units[par]
-        return("Error. Parameter key not found.")
+        return(PAVA_PARAMETER_UNITS.get(param.upper(),"Error. Parameter key not found."))
     def pava(self, channel=None, param=None, discret=False):
         '''Select parameter to PAVA - Parameter Value'''
         if param is None or param is True:
             if param is True:
                 discret=True
-            param='ALL'
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{0}={1}".format(set_channel,self.__pava_get(set_channel,param)))
-                return(channel_list)
+                return(self.__per_channel(self.__pava_all))
             else:
-                data_all=self.__pava_get(channel,param)
-                if discret:
-                    data_discret=[]
-                    for d in data_all:
-                        value=self.__discret_convert(float(d.split('=')[1]),self.__pava_param_units(d.split('=')[0]))
-                        data_discret.append("{}={}".format(d.split('=')[0],value))
-                    return(data_discret)
-                else:
-                    return(data_all)
+                return(self.__pava_all(channel, discret))
         else:
             data_all=self.__pava_get(channel,'ALL')
-            for d in data_all:
-                if param.upper() == d.split('=')[0]:    
-                    if discret:
-                        return self.__discret_convert(float(d.split('=')[1]),self.__pava_param_units(d.split('=')[0]))
-                    else:
-                        return float(d.split('=')[1])
+            if param.upper() in data_all:
+                if discret:
+                    return self.__discret_convert(float(data_all[param.upper()]),self.__pava_param_units(param))
+                else:
+                    return float(data_all[param.upper()])
             return("Error. Parameter not found.")
+    def __pava_all(self, channel, discret=False):
+        '''All parameters of PAVA - Parameter Value for one channel'''
+        data_all=self.__pava_get(channel,'ALL')
+        if discret:
+            data_all={key: self.__discret_convert(float(value),self.__pava_param_units(key)) for key,value in data_all.items()}
+        elif self.structured:
+            return({key: Oscilloscope.__typed(value) for key,value in data_all.items()})
+        if self.structured:
+            return(data_all)
+        return(["{}={}".format(key,value) for key,value in data_all.items()])
 
     # PEAK_DETECT
     def __pdet_get(self):
         '''Get configuration of PDET - Peak Detect'''
         query_results = self.osc.query("PDET?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def pdet(self, value=None):
         '''Set configuration to PDET - Peak Detect'''
         if value is None:
@@ -1373,8 +1863,8 @@ class Oscilloscope(object):
     def __pers_get(self):
         '''Get configuration of PERS - Persistence Display'''
         query_results = self.osc.query("PERS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def pers(self, value=None):
         '''Set configuration to PERS - Persistence Display'''
         if value is None:
@@ -1396,8 +1886,8 @@ class Oscilloscope(object):
     def __pesu_get(self):
         '''Get configuration of PESU - Persistence Display Setup'''
         query_results = self.osc.query("PESU?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def pesu(self, value=None):
         '''Set configuration to PESU - Persistence Display Setup'''
         if value is None:
@@ -1431,7 +1921,7 @@ class Oscilloscope(object):
     def __pfct_get(self):
         '''Get configuration of PFCT - Pass/Fail Controls'''
         query_results = self.osc.query("PFCT?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
     def pfct(self, trace=None, control=None, output=None, outputstop=None):
         '''Set configuration to PFCT - Pass/Fail Controls'''
@@ -1471,14 +1961,14 @@ class Oscilloscope(object):
     def pfdd(self):
         '''Query from PFDD - Pass/Fail Data Display'''
         query_results = self.osc.query("PFDD?").replace('PASS',',PASS')
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
 
     # PF_DISPLAY
     def __pfds_get(self):
         '''Get configuration of PFDS - Pass/Fail Display'''
         query_results = self.osc.query("PFDS?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
     def pfds(self, test=None, display=None):
         '''Set configuration to PFDS - Pass/Fail Display'''
@@ -1518,7 +2008,7 @@ class Oscilloscope(object):
     def __pfst_get(self):
         '''Get configuration of PFST - Pass/Fail Set Mask'''
         query_results = self.osc.query("PFST?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
     def pfst(self, xmask=None, ymask=None):
         '''Set configuration to PFST - Pass/Fail Set Mask'''
@@ -1548,6 +2038,7 @@ class Oscilloscope(object):
             if value is not None:
                 if value in range(1,21):
                     self.osc.write("*RCL {}".format(value))
+                    self.__invalidate()
                     return("Success. Recall Panel Setup Command set to memory {}.".format(value))
                 else:
                     raise Exception
@@ -1563,6 +2054,7 @@ class Oscilloscope(object):
             if file is not None:
                 if type(file) is str and str(file).upper().find('.SET') != -1:
                     self.osc.write("RCPN DISK,UDSK,FILE,'{}'".format(file.upper()))
+                    self.__invalidate()
                     return("Success. Recall Panel Command read from UDSK by FILE {}.".format(file.upper()))
                 else:
                     raise Exception
@@ -1574,6 +2066,7 @@ class Oscilloscope(object):
     # *RST
     def _rst(self):
         '''Command RST - Reset'''
+        self.__invalidate()
         return(self.osc.write("*RST"))
 
     # RUN
@@ -1599,21 +2092,22 @@ class Oscilloscope(object):
     def sara(self):
         '''Query value from SARA - Sample Rate'''
         query_results = self.osc.query("SARA?")
-        time.sleep(self.delay)
+        self.__pace()
         sara_unit = {'G':1E9,'M':1E6,'K':1E3}
         for unit in sara_unit.keys():
             if query_results.find(unit) !=-1:
                 sara_value = query_results.split(unit)
                 sara_value = float(sara_value[0])*sara_unit[unit]
                 break
+        self.__settings['SARA'] = float(sara_value)
         return float(sara_value)
 
     # SAMPLE_STATUS
     def sast(self):
         '''Query configuration from SAST - Sample Status'''
         query_results = self.osc.query("SAST?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
 
     # *SAV
     def _sav(self, value=None):
@@ -1631,21 +2125,74 @@ class Oscilloscope(object):
             raise Exception("Invalid input for *SAV - Save Panel Setup Command -> Use: value=[1 to 20]")
 
     # SCREEN_DUMP
-    def scdp(self):
-        '''Command SCDP - Screen Dump'''
-        chunk=self.osc.chunk_size
-        self.osc.chunk_size = 1024*1024
-        self.osc.write("SCDP")
-        image=self.osc.read_raw()
-        self.osc.chunk_size = chunk
-        return(image)
+    def scdp(self, file=None):
+        '''Command SCDP - Screen Dump, returning the bitmap or streaming it to file (path or binary file object)'''
+        with self.__lock:
+            self.__settle()
+            self.osc.write("SCDP")
+            header=self.osc.read_bytes(2)
+            if header == b'BM':
+                # BMP header declares the whole file size (little-endian) right after the signature
+                size=self.osc.read_bytes(4)
+                length=int.from_bytes(size,'little')
+                prefix=header+size
+            else:
+                length,prefix=self.__block_length(header)
+            if file is None:
+                return(bytes(self.__read_sized(length,prefix)))
+            elif type(file) is str:
+                with open(file,'wb') as f:
+                    return(self.__copy_sized(length,f,prefix))
+            else:
+                return(self.__copy_sized(length,file,prefix))
+    def scdp_array(self):
+        '''Screen Dump decoded into a (height, width, 3) RGB pixel array'''
+        return(bmp_to_array(self.scdp()))
+    def scdp_changed(self, file=None, interval=0.0, points=250, tolerance=0):
+        '''Screen Dump only when the display changed since the last one and at least interval seconds later, otherwise None'''
+        now=time.monotonic()
+        if self.__screen is not None and now-self.__screen[0] < interval:
+            return(None)
+        state=self.__screen_state(points)
+        if self.__screen is not None and self.__same_screen(self.__screen[1],state,tolerance):
+            return(None)
+        if type(file) is str:
+            # the file name may carry strftime fields, e.g. 'screen-%Y%m%d-%H%M%S.bmp'
+            file=time.strftime(file)
+        image=self.scdp(file)
+        self.__screen=(now,state)
+        return(file if type(file) is str else image)
+    def __screen_state(self, points):
+        '''Panel settings and coarse traces of the displayed channels, a cheap stand-in for the screen contents'''
+        with self.batch() as batch:
+            replies=[batch.defer("TDIV?"),batch.defer("TRMD?")]
+            for channel in range(1,(self.nchannels+1)):
+                replies.extend(batch.defer("C{}:{}?".format(channel,command)) for command in ('TRA','VDIV','OFST'))
+        settings=tuple(reply.value.strip() for reply in replies)
+        displayed=[channel for channel in range(1,(self.nchannels+1)) if settings[3*channel-1].upper().endswith('ON')]
+        traces=[]
+        if displayed:
+            sparsing=min(50,max(1,-(-int(self.sanu(displayed[0]))//max(1,points))))
+            with self.__wfsu_kept():
+                traces=[self.__wf_raw(channel,(sparsing,0,0,0)) for channel in displayed]
+        return(settings,traces)
+    @staticmethod
+    def __same_screen(last, state, tolerance):
+        if last[0] != state[0] or len(last[1]) != len(state[1]):
+            return(False)
+        for previous,current in zip(last[1],state[1]):
+            if len(previous) != len(current):
+                return(False)
+            if len(current) and np.abs(previous.astype(np.int16)-current).max() > tolerance:
+                return(False)
+        return(True)
 
     #SCREEN_SAVE
     def __scsv_get(self):
         '''Get configuration of SCSV - Screen Save'''
         query_results = self.osc.query("SCSV?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def scsv(self, value=None):
         '''Set configuration to SCSV - Screen Save'''
         if value is None:
@@ -1669,8 +2216,8 @@ class Oscilloscope(object):
     def __sxsa_get(self):
         '''Get configuration of SXSA - Sinx/X Sample'''
         query_results = self.osc.query("SXSA?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def sxsa(self, value=None):
         '''Set configuration to SXSA - Sinx/X Sample'''
         if value is None:
@@ -1692,8 +2239,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:SKEW?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -1702,10 +2249,7 @@ class Oscilloscope(object):
         '''Set configuration to SKEW - Skew Command'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__skew_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__skew_get))
             else:
                 return self.__skew_get(channel)
         else:
@@ -1731,8 +2275,8 @@ class Oscilloscope(object):
     def __sre_get(self):
         '''Query from *SRE - Service Request Enable'''
         query_results = self.osc.query("*SRE?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def _sre(self, value=None):
         '''Command for *SRE - Service Request Enable'''
         if value is None:
@@ -1751,7 +2295,7 @@ class Oscilloscope(object):
     def _stb(self):
         '''Query *STB? - Status Register'''
         query_results = self.osc.query("*STB?")
-        time.sleep(self.delay)
+        self.__pace()
         return(int(query_results))
     
     # STOP
@@ -1790,7 +2334,7 @@ class Oscilloscope(object):
     def __stst_get(self):
         '''Query from STST - Store Setup'''
         query_results = self.osc.query("STST?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
     def stst(self, trace=None, dest=None):
         '''Command for STST - Store Setup'''
@@ -1810,7 +2354,7 @@ class Oscilloscope(object):
     def tmpl(self):
         '''Query TMPL - Template'''
         query_results = self.osc.query("TMPL?")
-        time.sleep(self.delay)
+        self.__pace()
         return(query_results)
 
 
@@ -1818,7 +2362,8 @@ class Oscilloscope(object):
     def __tdiv_get(self, discret=False):
         '''Get value of TDIV - Time Div'''
         query_results = self.osc.query("TDIV?")
-        time.sleep(self.delay)
+        self.__pace()
+        self.__settings['TDIV'] = float(query_results)
         if discret:
             return self.__discret_convert(float(query_results))
         else:
@@ -1834,6 +2379,7 @@ class Oscilloscope(object):
                                 '50us', '100us', '250us', '500us', '1ms', '2.5ms', '5ms', '10ms', '25ms', '50ms', '100ms', '250ms',
                                 '500ms', '1s', '2.5s', '5s', '10s', '25s', '50s'):
                         self.osc.write("TDIV {}".format(value))
+                        self.__invalidate('TDIV','SARA')
                         return("Success. Time Div to {}.".format(value))
                     else:
                         raise Exception
@@ -1842,6 +2388,7 @@ class Oscilloscope(object):
                 else:
                     if value >= 2.50E-9 and value <= 50:
                         self.osc.write("TDIV {}".format(value))
+                        self.__invalidate('TDIV','SARA')
                         return("Success. Time Div to {}.".format(value))
                     else:
                         raise Exception
@@ -1859,8 +2406,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:TRA?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -1869,10 +2416,7 @@ class Oscilloscope(object):
         '''Set configuration to TRA - Trace'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__tra_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__tra_get))
             else:
                 return self.__tra_get(channel)
         else:
@@ -1912,74 +2456,26 @@ class Oscilloscope(object):
     def __trdl_get(self):
         '''Get configuration of TRDL - Trigger Delay'''
         query_results = self.osc.query("TRDL?")
-        time.sleep(self.delay)
+        self.__pace()
         return(Oscilloscope.format_results(query_results).lower())
     def trdl(self, value=None):
         '''Set configuration to TRDL - Trigger Delay'''
         if value is None:
             return(self.__trdl_get())
         else:
+            minmax=trigger_delay_range(self.__cached('TDIV',self.tdiv))
+            min=self.__discret_convert(minmax[0])
+            max=self.__discret_convert(minmax[1])
             try:
                 if type(value) is str:
                     value=self.__indiscret_convert(self.__std(value))
-                if self.__trdl_onlimits(value):
+                if value >= minmax[0] and value <= minmax[1]:
                     self.osc.write("TRDL {}".format(value))
                     return("Success. Trigger Delay set to {}.".format(self.__discret_convert(value)))
                 else:
-                    minmax=self.__trdl_onlimits(value,True)
-                    min=self.__discret_convert(minmax[0])
-                    max=self.__discret_convert(minmax[1])
-
                     raise Exception(min,max)
             except:
                 raise Exception("Invalid input for TRDL - Trigger Delay -> Use: values=[ between {} and {} ]".format(min,max))
-    def __trdl_onlimits(self, value=None, range=False):
-        tdiv=self.__discret_convert(self.tdiv())
-        for trdl_limits in self.__trdl_limits():
-            if trdl_limits[0].find(tdiv) == 0:
-                break
-        if range:
-            return(trdl_limits[1],trdl_limits[2]) 
-        else:
-            if value >= trdl_limits[1] and value <= trdl_limits[2]:
-                return True
-            else:
-                return False
-    def __trdl_limits(self):
-        return(\
-        # TDIV       MIN(Seg)      MAX(Seg)
-        [['2.50ns', -4.31160e-06, 3.47550e-07],\
-        ['5ns'   , -7.12350e-06, 6.95100e-07],\
-        ['10ns'  , -1.05704e-05, 1.39020e-06],\
-        ['25ns'  , -1.48945e-05, 3.47540e-06],\
-        ['50ns'  , -1.72459e-05, 6.95100e-06],\
-        ['100ns' , -2.04799e-05, 1.39019e-05],\
-        ['250ns' , -1.97399e-05, 3.47550e-05],\
-        ['500ns' , -3.94799e-05, 6.95100e-05],\
-        ['1us'   , -4.09599e-05, 0.000139020],\
-        ['2.50us' , -0.000102400, 0.000347550],\
-        ['5us'   , -0.000102400, 0.000695100],\
-        ['10us'  , -0.000102400, 0.001390200],\
-        ['25us'  , -0.000406500, 0.003475500],\
-        ['50us'  , -0.000813000, 0.006951001],\
-        ['100us' , -0.002048000, 0.013902000],\
-        ['250us' , -0.004065000, 0.034755000],\
-        ['500us' , -0.008130000, 0.069510000],\
-        ['1ms'   , -0.020479990, 0.139020000],\
-        ['2.50ms' , -0.040650000, 0.347550000],\
-        ['5ms'   , -0.081300000, 0.695100000],\
-        ['10ms'  , -0.204800000, 1.390200000],\
-        ['25ms'  , -0.406500000, 3.475500000],\
-        ['50ms'  , -0.813000000, 6.951001000],\
-        ['100ms' , -0.800000000, 0.800000000],\
-        ['250ms' , -2.000000000, 2.000000000],\
-        ['500ms' , -4.000000000, 4.000000000],\
-        ['1s'    , -8.000000000, 8.000000000],\
-        ['2.50s'  , -20.00000000, 20.00000000],\
-        ['5s'    , -40.00000000, 40.00000000],\
-        ['10s'   , -80.00000000, 80.00000000],\
-        ['25s'   , -200.0000000, 200.0000000],\
-        ['50s'   , -400.0000000, 400.0000000]])
 
     # TRIG_LEVEL
     def __trlv_get(self, channel=None):
@@ -1992,19 +2488,20 @@ class Oscilloscope(object):
                     query_results = self.osc.query("{}:TRLV?".format(channel))
                 else:
                     raise Exception
-                time.sleep(self.delay)
-                return(Oscilloscope.format_results(query_results))
+                self.__pace()
+                return(self.__results(query_results))
             except:
                 raise Exception("Invalid input for TRLV - Trigger Level -> Use: channel=[1 to {}, 'EX' or 'EX5']".format(self.nchannels))
     def trlv(self, channel=None, value=None):
         '''Set configuration to TRLV - Trigger Level'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__trlv_get(set_channel)))
+                channel_list=self.__per_channel(self.__trlv_get)
                 for set_channel in ('EX', 'EX5'):
-                    channel_list.append("{}={}".format(set_channel,self.__trlv_get(set_channel)))
+                    if self.structured:
+                        channel_list[set_channel]=self.__trlv_get(set_channel)
+                    else:
+                        channel_list.append("{}={}".format(set_channel,self.__trlv_get(set_channel)))
                 return channel_list
             else:
                 return self.__trlv_get(channel)
@@ -2033,8 +2530,8 @@ class Oscilloscope(object):
     def __trmd_get(self):
         '''Get configuration of TRMD - Trigger Mode'''
         query_results = self.osc.query("TRMD?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def trmd(self, value=None):
         '''Set configuration to TRMD - Trigger Mode'''
         if value is None:
@@ -2321,8 +2818,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:UNIT?".format(channel))
-                    time.sleep(self.delay)
-                    return(Oscilloscope.format_results(query_results))
+                    self.__pace()
+                    return(self.__results(query_results))
                 else:
                     raise Exception
             except:
@@ -2331,10 +2828,7 @@ class Oscilloscope(object):
         '''Set configuration to UNIT - Unit'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__unit_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__unit_get))
             else:
                 return self.__unit_get(channel)
         else:
@@ -2354,7 +2848,7 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:VTCL?".format(channel))
-                    time.sleep(self.delay)
+                    self.__pace()
                     highpos_LVL=str(float(query_results.split(',')[0])*self.vdiv(channel)/50)+'V'
                     lowpos_LVL=str(float(query_results.split(',')[1])*self.vdiv(channel)/50)+'V'
                     return(highpos_LVL,lowpos_LVL)
@@ -2367,10 +2861,7 @@ class Oscilloscope(object):
         value_discret=None
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__vtcl_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__vtcl_get))
             else:
                 return self.__vtcl_get(channel)
         else:
@@ -2419,7 +2910,8 @@ class Oscilloscope(object):
             try:
                 if channel in (range(1,(self.nchannels+1))):
                     query_results = self.osc.query("C{}:VDIV?".format(channel))
-                    time.sleep(self.delay)
+                    self.__pace()
+                    self.__settings[('VDIV',channel)] = float(query_results)
                     return float(query_results)
                 else:
                     raise Exception
@@ -2429,10 +2921,7 @@ class Oscilloscope(object):
         '''Set value of VDIV - Volt Div'''
         if value is None:
             if channel is None:
-                channel_list=[]
-                for set_channel in (range(1,(self.nchannels+1))):
-                    channel_list.append("C{}={}".format(set_channel,self.__vdiv_get(set_channel)))
-                return channel_list
+                return(self.__per_channel(self.__vdiv_get))
             else:
                 return self.__vdiv_get(channel)
         else:
@@ -2442,12 +2931,14 @@ class Oscilloscope(object):
                         value=self.__std(value)
                         if value in ('2mV', '5mV', '10mV', '20mV', '50mV', '100mV', '200mV', '500mV', '1V', '2V', '5V', '10V'):
                             self.osc.write("C{}:VDIV {}".format(channel,value))
+                            self.__invalidate(('VDIV',channel),('OFST',channel))
                             return("Success. Volt Div to {} on channel {}.".format(value,channel))
                         else:
                             raise Exception
                     else:
                         if value >= 0.002 and value <= 10:
                             self.osc.write("C{}:VDIV {}".format(channel,value))
+                            self.__invalidate(('VDIV',channel),('OFST',channel))
                             return("Success. Volt Div to {}V on channel {}.".format(value,channel))
                         else:
                             raise Exception
@@ -2464,68 +2955,309 @@ class Oscilloscope(object):
         else:
             return(self.osc.write("WAIT {}".format(time)))
 
+    # SINGLE_ACQUISITION
+    def acquire_single(self, channel=None, timeout=10.0, srq=None, poll=0.001, max_poll=0.05):
+        '''Arm one acquisition, wait until it completes (service request, or INR? polled with exponential backoff) and get WF - Waveform'''
+        if (channel is not None and channel not in (range(1,(self.nchannels+1)))) or timeout <= 0 or poll <= 0:
+            raise Exception("Invalid input for acquire_single -> Use: channel=[None (all enabled) or 1 to {}], timeout=[seconds > 0], srq=[None (when the resource has wait_for_srq), True or False], poll=[seconds > 0]".format(self.nchannels))
+        deadline=time.perf_counter()+timeout
+        if srq is None:
+            # every pyvisa resource has enable_event, but only those with wait_for_srq (GPIB, simulator) reliably deliver the request
+            srq=callable(getattr(self.osc,'wait_for_srq',None))
+        # INR? is read-and-clear: drop a completion left over from an earlier acquisition
+        self.inr()
+        if srq:
+            previous=int(float(self.__sre_get()))
+            previous_ine=int(float(self.osc.query("INE?")))
+            self.__pace()
+            # INR bit 0 (new signal acquired) -> STB bit 0 -> service request
+            self.osc.write("INE {}".format(previous_ine | 1))
+            self._sre(previous | 1)
+        try:
+            self.arm()
+            completed=self.__wait_srq(deadline) if srq else None
+            if completed is False:
+                # the request may have been lost on the way: the INR bit still tells
+                completed=bool(self.inr() & 1)
+            elif completed is None:
+                completed=self.__poll_inr(deadline, poll, max_poll)
+            if not completed:
+                raise Exception("Timeout. No acquisition completed within {} s.".format(timeout))
+        finally:
+            if srq:
+                self._sre(previous)
+                self.osc.write("INE {}".format(previous_ine))
+        if channel is None:
+            return(self.wf_multi(stop=False))
+        return(self.waveform(channel))
+    def __wait_srq(self, deadline):
+        '''Block until the service request of a completed acquisition: True, False on timeout, None when the transport cannot wait for it'''
+        timeout=max(1,int((deadline-time.perf_counter())*1000))
+        try:
+            if callable(getattr(self.osc,'wait_for_srq',None)):
+                self.osc.wait_for_srq(timeout)
+            else:
+                self.osc.enable_event(pyvisa.constants.EventType.service_request, pyvisa.constants.EventMechanism.queue)
+                try:
+                    self.osc.wait_on_event(pyvisa.constants.EventType.service_request, timeout)
+                finally:
+                    self.osc.disable_event(pyvisa.constants.EventType.service_request, pyvisa.constants.EventMechanism.queue)
+        except pyvisa.errors.VisaIOError as error:
+            if error.error_code == pyvisa.constants.StatusCode.error_timeout:
+                return(False)
+            return(None)
+        except NotImplementedError:
+            return(None)
+        # clear the INR bit that raised the request
+        self.inr()
+        return(True)
+    def __poll_inr(self, deadline, poll, max_poll):
+        '''Poll INR? bit 0 (new signal acquired), doubling the interval up to max_poll; False on timeout'''
+        delay=poll
+        while not (self.inr() & 1):
+            remaining=deadline-time.perf_counter()
+            if remaining <= 0:
+                return(False)
+            self.__sleep(min(delay,remaining))
+            delay=min(delay*2,max_poll)
+        return(True)
+
     # WAVEFORM
-    def wf(self, channel=None):
-        '''Get data of WF - Waveform'''
+    def __wf_raw(self, channel, setup=None):
+        '''Get raw int8 samples of WF - Waveform, optionally sending a WFSU setup in the same message'''
+        # the resource stays ours from the query to the last read of its reply (see LockedResource)
+        with self.__lock:
+            self.__settle()
+            if setup is None:
+                self.osc.write("C{}:WF? DAT2".format(channel))
+            else:
+                self.osc.write("WFSU SP,{},NP,{},FP,{},SN,{};C{}:WF? DAT2".format(*setup,channel))
+            return(np.frombuffer(self.__read_block(trailer=2), dtype=np.int8))
+    def waveform(self, channel=None):
+        '''Get WF - Waveform as a Waveform object holding the raw samples'''
         if channel in (range(1,(self.nchannels+1))):
-            VDIV=self.vdiv(channel)
-            OFST=self.ofst(channel)
-            TDIV=self.tdiv()
-            SARA=self.sara()
+            scales=self.__scales(channel)
             try:
-                self.osc.write("C{}:WF? DAT2".format(channel))
-                recv = self.osc.read_raw()[15:-2]
-                volt_value = []
-                for data in recv:
-                    if data > 127:
-                        data = data - 255
-                    volt_value.append(data)
-                time_value = []
-                for idx in range(0,len(volt_value)):
-                    volt_value[idx] = volt_value[idx] / 25 * VDIV - OFST
-                    time_data = -( (TDIV) * 14 / 2 ) + idx * (1/SARA)
-                    time_value.append(time_data)
-                return(time_value, volt_value)
+                return(Waveform(self.__wf_raw(channel),*scales,channel))
             except:
                 raise Exception("Failed to get WF - Waveform.")
         else:
             raise Exception("Invalid input for WF - Waveform -> Use: channel=[1 to {}]".format(self.nchannels))
+    def wf(self, channel=None):
+        '''Get data of WF - Waveform'''
+        if channel is None:
+            return(self.wf_multi())
+        return(tuple(self.waveform(channel)))
+    def wf_paged(self, channel=None, page=14000, progress=None):
+        '''Get WF - Waveform of a long record in WFSU first-point/number-of-points windows'''
+        if channel not in (range(1,(self.nchannels+1))) or page < 1:
+            raise Exception("Invalid input for WF - Waveform -> Use: channel=[1 to {}], page=[>= 1 points]".format(self.nchannels))
+        scales=self.__scales(channel)
+        total=int(self.sanu(channel))
+        raw=np.empty(total,dtype=np.int8)
+        first=0
+        with self.__wfsu_kept():
+            try:
+                while first < total:
+                    data=self.__wf_raw(channel,(1,min(page,total-first),first,0))
+                    if len(data) == 0:
+                        raise Exception
+                    received=min(len(data),total-first)
+                    raw[first:first+received]=data[0:received]
+                    first+=received
+                    if progress is not None:
+                        progress(first,total)
+            except:
+                raise Exception("Failed to get WF - Waveform page at point {} of {}.".format(first,total))
+        return(Waveform(raw,*scales,channel))
+    def wf_preview(self, channel=None, max_points=1000):
+        '''Get a coarse WF - Waveform of about max_points points using WFSU sparsing'''
+        if channel not in (range(1,(self.nchannels+1))) or max_points < 1:
+            raise Exception("Invalid input for WF - Waveform -> Use: channel=[1 to {}], max_points=[>= 1]".format(self.nchannels))
+        scales=self.__scales(channel)
+        total=int(self.sanu(channel))
+        # WFSU accepts a sparsing interval of 1 to 50 points
+        sparsing=min(50,max(1,-(-total//max_points)))
+        with self.__wfsu_kept():
+            try:
+                raw=self.__wf_raw(channel,(sparsing,0,0,0))
+            except:
+                raise Exception("Failed to get WF - Waveform.")
+        return(Waveform(raw,*scales,channel,sparsing=sparsing))
+    def wf_window(self, channel=None, start=None, stop=None):
+        '''Get full resolution WF - Waveform only between start and stop seconds (relative to the trigger)'''
+        if channel not in (range(1,(self.nchannels+1))) or start is None or stop is None or stop <= start:
+            raise Exception("Invalid input for WF - Waveform -> Use: channel=[1 to {}], start=[seconds], stop=[seconds > start]".format(self.nchannels))
+        scales=self.__scales(channel)
+        total=int(self.sanu(channel))
+        # the time axis of the whole record maps start and stop to sample indices
+        axis=Waveform(np.empty(0,dtype=np.int8),*scales,channel)
+        first=min(total-1,max(0,int(round((start-axis.t0)/axis.dt))))
+        last=min(total-1,max(first,int(round((stop-axis.t0)/axis.dt))))
+        with self.__wfsu_kept():
+            try:
+                raw=self.__wf_raw(channel,(1,last-first+1,first,0))
+            except:
+                raise Exception("Failed to get WF - Waveform.")
+        return(Waveform(raw,*scales,channel,first=first))
+    def wf_multi(self, channels=None, stop=True):
+        '''Get data of WF - Waveform from several channels of the same acquisition'''
+        if channels is None:
+            channels=[channel for channel in range(1,(self.nchannels+1)) if self.tra(channel) == 'ON']
+        if len(channels) == 0 or any(channel not in range(1,(self.nchannels+1)) for channel in channels):
+            raise Exception("Invalid input for WF - Waveform -> Use: channels=[list of enabled channels 1 to {}]".format(self.nchannels))
+        scales=[self.__scales(channel) for channel in channels]
+        resume=False
+        try:
+            if stop:
+                # freeze the display so every channel is read from the same acquisition
+                resume=self.trmd() in ('AUTO','NORM')
+                self.stop()
+            raw=[self.__wf_raw(channel) for channel in channels]
+        except:
+            raise Exception("Failed to get WF - Waveform.")
+        finally:
+            if resume:
+                self.run()
+        samples=min(len(data) for data in raw)
+        waveforms=[Waveform(data[:samples],*scale,channel) for data,scale,channel in zip(raw,scales,channels)]
+        volt_value=np.empty((len(channels),samples))
+        for row,waveform in enumerate(waveforms):
+            waveform.scale(out=volt_value[row])
+        return(waveforms[0].time, volt_value)
+
+    # WAVEFORM_STREAM
+    def __stream_raw(self, channel):
+        '''Arm, wait for a complete acquisition and get raw int8 samples of WF - Waveform'''
+        # runs on the stream thread: INR? polling rather than a blocking WAIT leaves the resource free for the caller's commands
+        self.arm()
+        if not self.__poll_inr(time.perf_counter()+self.osc.timeout/1000, 0.001, 0.05):
+            raise Exception("Timeout. No acquisition completed within {} s.".format(self.osc.timeout/1000))
+        return(self.__wf_raw(channel))
+    def stream(self, channel=None, frames=None, depth=8, backpressure='drop'):
+        '''Continuously re-arm and yield (time, volt) frames of WF - Waveform from a bounded ring buffer'''
+        if channel not in (range(1,(self.nchannels+1))) or (frames is not None and frames < 1) or depth < 2 \
+                or str(backpressure).upper() not in ('DROP','BLOCK'):
+            raise Exception("Invalid input for WF - Waveform stream -> Use: channel=[1 to {}], frames=[None or >= 1], depth=[>= 2], backpressure=['DROP' or 'BLOCK']".format(self.nchannels))
+        block=backpressure.upper() == 'BLOCK'
+        scales=self.__scales(channel)
+        try:
+            # INR? is read-and-clear: drop a completion left over from an earlier acquisition
+            self.inr()
+            first=self.__stream_raw(channel)
+        except:
+            raise Exception("Failed to get WF - Waveform.")
+        samples=len(first)
+        time_value=Waveform(first,*scales,channel).time
+        # every frame lives in one preallocated slot; the consumer holds at most one slot at a time
+        ring=np.empty((depth,samples))
+        free=collections.deque(range(depth))
+        ready=collections.deque()
+        cond=threading.Condition()
+        state={'stop':False,'done':False,'error':None}
+        self.stream_dropped=0
+        def producer():
+            raw=first
+            produced=0
+            try:
+                while True:
+                    with cond:
+                        while not free and block and not state['stop']:
+                            cond.wait()
+                        if state['stop']:
+                            break
+                        if free:
+                            slot=free.popleft()
+                        else:
+                            slot=ready.popleft()
+                            self.stream_dropped+=1
+                    if len(raw) != samples:
+                        raise Exception("Error. WF - Waveform frame size changed from {} to {} samples.".format(samples,len(raw)))
+                    Waveform(raw,*scales,channel).scale(out=ring[slot])
+                    with cond:
+                        ready.append(slot)
+                        cond.notify_all()
+                    produced+=1
+                    if frames is not None and produced >= frames:
+                        break
+                    raw=self.__stream_raw(channel)
+            except Exception as error:
+                state['error']=error
+            finally:
+                with cond:
+                    state['done']=True
+                    cond.notify_all()
+        worker=threading.Thread(target=producer, daemon=True)
+        worker.start()
+        lent=None
+        try:
+            while True:
+                with cond:
+                    if lent is not None:
+                        free.append(lent)
+                        lent=None
+                        cond.notify_all()
+                    while not ready and not state['done']:
+                        cond.wait()
+                    if ready:
+                        lent=ready.popleft()
+                    elif state['error'] is not None:
+                        raise Exception("Failed to stream WF - Waveform: {}".format(state['error']))
+                    else:
+                        return
+                yield(time_value, ring[lent])
+        finally:
+            with cond:
+                state['stop']=True
+                cond.notify_all()
+            worker.join()
 
     # WAVEFORM_SETUP
+    @contextlib.contextmanager
+    def __wfsu_kept(self):
+        '''Restore the current WFSU - Waveform Setup when the block exits'''
+        setup=Oscilloscope.parse_results(self.__wfsu_get())
+        try:
+            yield
+        finally:
+            self.osc.write("WFSU SP,{SP},NP,{NP},FP,{FP},SN,{SN}".format(**setup))
     def __wfsu_get(self):
         '''Get configuration of WFSU - Waveform Setup'''
         query_results = self.osc.query("WFSU?")
-        time.sleep(self.delay)
-        return Oscilloscope.format_results(query_results)
+        self.__pace()
+        return(query_results)
     def wfsu(self, sp=None, np=None, fp=None, sn=None):
         '''Set configuration to WFSU - Waveform Setup'''
+        if None in (sp, np, fp, sn):
+            query_results = self.__wfsu_get()
+            current_values = Oscilloscope.parse_results(query_results)
         nones=0        
         if sp is None:
-            sp = self.__wfsu_get()[0].split('=')[1]
+            sp = current_values['SP']
             nones+=1
         else:
             if sp not in range(1,51):
                 raise Exception("Invalid input for WFSU - Waveform Setup -> Use: sp=[1~50]")
         if np is None:
-            np = self.__wfsu_get()[1].split('=')[1]
+            np = current_values['NP']
             nones+=1
         else:
             if np not in range(0,int(self.sanu(1))+1):
                 raise Exception("Invalid input for WFSU - Waveform Setup -> Use: np=[0~{}]".format(int(self.sanu(1))))
         if fp is None:
-            fp = self.__wfsu_get()[2].split('=')[1]
+            fp = current_values['FP']
             nones+=1
         else:
             if fp not in range(0,20001):
                 raise Exception("Invalid input for WFSU - Waveform Setup -> Use: fp=[0~20000]")
         if sn is None:
-            sn = self.__wfsu_get()[3].split('=')[1]
+            sn = current_values['SN']
             nones+=1
         else:
             if sn not in range(0,1001):
                 raise Exception("Invalid input for WFSU - Waveform Setup -> Use: sn=[0~1000]")
         if nones == 4:
-            return self.__wfsu_get()
+            return(self.__results(query_results))
         else:
             try:
                 self.osc.write("WFSU SP,{},NP,{},FP,{},SN,{}".format(sp,np,fp,sn))
@@ -2537,8 +3269,8 @@ class Oscilloscope(object):
     def __xyds_get(self):
         '''Get configuration of XYDS - XY Display'''
         query_results = self.osc.query("XYDS?")
-        time.sleep(self.delay)
-        return(Oscilloscope.format_results(query_results))
+        self.__pace()
+        return(self.__results(query_results))
     def xyds(self, value=None):
         '''Set configuration to XYDS - XY Display'''
         if value is None:
@@ -2557,6 +3289,134 @@ class Oscilloscope(object):
             except:
                 raise Exception("Invalid input for XYDS - XY Display -> Use: value=['ON' or 'OFF']")
 
+    # PACING
+    def __pace(self, settle=None, sync=False):
+        '''Pause after an instrument transaction according to the pacing policy'''
+        if self.__pacing == 'FIXED':
+            self.__sleep(self.delay if settle is None else settle)
+        elif sync:
+            # a query reply is already synchronous: a write that must settle (MENU) is synced before the next data read
+            self.__unsettled = time.perf_counter()
+    def __sleep(self, seconds):
+        '''Sleep, reporting the time to the instrumentation as part of the current transaction'''
+        time.sleep(seconds)
+        if self.__stats is not None:
+            self.__stats.sleep(seconds)
+    def __settle(self):
+        '''ADAPTIVE pacing: before a data read, wait on *OPC? for the settings written since the last sync, unless their measured settle time has passed'''
+        if self.__pacing != 'ADAPTIVE' or self.__unsettled is None:
+            return
+        if self.response_time is not None and time.perf_counter()-self.__unsettled > 2*self.response_time:
+            self.__unsettled = None
+            return
+        self.osc.query("*OPC?")
+        # from the settling write to its completion: an upper bound, so late syncs only make skipping rarer
+        elapsed = time.perf_counter()-self.__unsettled
+        self.response_time = elapsed if self.response_time is None else 0.8*self.response_time+0.2*elapsed
+        self.__unsettled = None
+    def pacing(self, mode=None):
+        '''Set pacing policy used after instrument transactions'''
+        if mode is None:
+            return(self.__pacing)
+        else:
+            try:
+                if mode.upper() in ('NONE','FIXED','ADAPTIVE'):
+                    self.__pacing=mode.upper()
+                    return("Success. Pacing set to {}.".format(mode.upper()))
+                else:
+                    raise Exception
+            except:
+                raise Exception("Invalid input for pacing -> Use: mode=['NONE', 'FIXED' (sleep delay after every query) or 'ADAPTIVE' (*OPC? sync before data reads that follow a settings change, skipped once the measured settle time has passed)]")
+
+    # INSTRUMENTATION
+    def instrumentation(self, enabled=None):
+        '''Turn per-command latency statistics on or off (off costs nothing: the resource is not wrapped)'''
+        if enabled is None:
+            return(self.__stats is not None)
+        elif enabled is True or enabled is False:
+            if enabled and self.__stats is None:
+                self.__stats = CommandStats()
+                self.__insert_proxy(InstrumentedResource, self.__stats)
+            elif not enabled and self.__stats is not None:
+                self.__stats = None
+                self.__remove_proxy(InstrumentedResource)
+            return("Success. Instrumentation set to {}.".format('ON' if enabled else 'OFF'))
+        else:
+            raise Exception("Invalid input for instrumentation -> Use: enabled=[True or False]")
+    def command_stats(self, reset=False, buckets=False):
+        '''Per-mnemonic count, bytes, time, sleep and latency percentiles of the instrument traffic since enabled (or the last reset)'''
+        if self.__stats is None:
+            raise Exception("Error. Instrumentation is disabled -> Use: instrumentation(True)")
+        return(self.__stats.snapshot(reset, buckets))
+
+    # TRACE_RECORDING
+    def record(self, path=None):
+        '''Append every request and reply to a trace file for ReplayResource (None stops); start before connecting (lazy=True) to include the handshake'''
+        self.__remove_proxy(TraceRecorder)
+        self.__trace = path
+        if path is None:
+            return("Success. Trace recording stopped.")
+        self.__insert_proxy(TraceRecorder, path)
+        return("Success. Recording trace to {}.".format(path))
+    def __insert_proxy(self, cls, *args):
+        '''Wrap the open resource in a proxy of class cls, under the LockedResource'''
+        if isinstance(self.__osc, LockedResource):
+            object.__setattr__(self.__osc, 'resource', cls(self.__osc.resource, *args))
+        elif self.__osc is not None:
+            self.__osc = cls(self.__osc, *args)
+    def __remove_proxy(self, cls):
+        '''Take the proxy of class cls out of the resource chain'''
+        parent = None
+        node = self.__osc
+        while isinstance(node, ResourceProxy):
+            if isinstance(node, cls):
+                if isinstance(node, TraceRecorder):
+                    node.close_trace()
+                if parent is None:
+                    self.__osc = node.resource
+                else:
+                    object.__setattr__(parent, 'resource', node.resource)
+                return
+            parent = node
+            node = node.resource
+
+    # COMMAND_BATCH
+    @contextlib.contextmanager
+    def batch(self, max_length=512):
+        '''Collect commands and queries of this thread and send them as semicolon-joined messages'''
+        previous = getattr(self.__local, 'batch', None)
+        batch = CommandBatch(self.osc, max_length)
+        self.__local.batch = batch
+        try:
+            yield batch
+            batch.flush()
+        finally:
+            self.__local.batch = previous
+
+    # SETTINGS_CACHE
+    def __cached(self, key, getter, *args):
+        '''Get a scale/timebase setting from the cache, querying the instrument on a miss'''
+        if self.cache and key in self.__settings:
+            return(self.__settings[key])
+        return(getter(*args))
+    def __scales(self, channel):
+        '''VDIV, OFST, TDIV and SARA for scaling a channel's samples (Waveform arguments), from the cache where possible'''
+        return(self.__cached(('VDIV',channel),self.vdiv,channel),self.__cached(('OFST',channel),self.ofst,channel),
+               self.__cached('TDIV',self.tdiv),self.__cached('SARA',self.sara))
+    def __invalidate(self, *keys):
+        '''Drop the given keys (or every key) from the settings cache'''
+        # a scale/timebase change also has to settle before the next data read (ADAPTIVE pacing)
+        self.__unsettled = time.perf_counter()
+        if keys:
+            for key in keys:
+                self.__settings.pop(key, None)
+        else:
+            self.__settings.clear()
+    def refresh_settings(self):
+        '''Discard cached scale/timebase settings so the next use re-reads them from the instrument'''
+        self.__invalidate()
+        return("Success. Settings cache cleared.")
+
     # UTILS FUNCTIONS
     @staticmethod
     def format_results(query_results):
@@ -2573,115 +3433,128 @@ class Oscilloscope(object):
                 return int(lenght_field[0])
             except:
                 return str(lenght_field[0]).upper()
+    @staticmethod
+    def parse_results(query_results):
+        '''Parse a reply in one pass: a dict of typed values for KEY,value lists, otherwise a single typed value'''
+        fields=query_results.strip().split(',')
+        if len(fields) > 1:
+            return({str(key).strip().upper(): Oscilloscope.__typed(value) for key,value in zip(fields[0::2],fields[1::2])})
+        else:
+            return(Oscilloscope.__typed(fields[0]))
+    @staticmethod
+    def __typed(value):
+        '''Convert a reply field to int, float or upper-case string (enum)'''
+        value=value.strip()
+        try:
+            return(int(value))
+        except ValueError:
+            try:
+                return(float(value))
+            except ValueError:
+                return(value.upper())
+    def __results(self, query_results):
+        '''Format a reply as typed values or "KEY=value" strings, depending on structured'''
+        if self.structured:
+            return(Oscilloscope.parse_results(query_results))
+        return(Oscilloscope.format_results(query_results))
+    def __per_channel(self, getter):
+        '''Collect a getter over all channels: {channel: value} when structured, otherwise "Cn=value" strings'''
+        if self.structured:
+            return({channel: getter(channel) for channel in range(1,(self.nchannels+1))})
+        return(["C{}={}".format(channel,getter(channel)) for channel in range(1,(self.nchannels+1))])
 
-    def __discret_convert(self, value=None, unit='s', dp=2):
-        if value >= 0:
-            signal=''
-        else:
-            signal='-'
-        value=abs(value)
-        if unit not in ('%'):
-            if value >= 1e24:
-                # yotta
-                value = value * 1e-24
-                unit='Y'+unit
-            elif value >= 1e21:
-                # zetta
-                value = value * 1e-21
-                unit='Z'+unit
-            elif value >= 1e18:
-                # exa
-                value = value * 1e-18
-                unit='E'+unit
-            elif value >= 1e15:
-                # peta
-                value = value * 1e-15
-                unit='P'+unit
-            elif value >= 1e12:
-                # tera
-                value = value * 1e-12
-                unit='T'+unit
-            elif value >= 1e9:
-                # giga
-                value = value * 1e-9
-                unit='G'+unit
-            elif value >= 1e6:
-                # mega
-                value = value * 1e-6
-                unit='M'+unit
-            elif value >= 1e3:
-                # kilo
-                value = value * 1e-3
-                unit='K'+unit
-            elif value >= 1e-0:
-                # base
-                value = value * 1e0
-                unit=unit
-            elif value >= 1e-3:
-                # mili
-                value = value * 1e3
-                unit='m'+unit
-            elif value >= 1e-6:
-                # micro
-                value = value * 1e6
-                unit='u'+unit
-            elif value >= 1e-9:
-                # nano
-                value = value * 1e9
-                unit='n'+unit
-            elif value >= 1e-12:
-                # pico
-                value = value * 1e12
-                unit='p'+unit
-            elif value >= 1e-15:
-                # femto
-                value = value * 1e15
-                unit='f'+unit
-            elif value >= 1e-18:
-                # atto
-                value = value * 1e18
-                unit='a'+unit
-            elif value >= 1e-21:
-                # zepto
-                value = value * 1e21
-                unit='z'+unit
-            elif value >= 1e-24:
-                # yocto
-                value = value * 1e24
-                unit='y'+unit
-        if dp == 2:
-            if value % 1 > 0.0000001:
-                return "{}{:.2f}{}".format(signal,float(value),unit)
-            else:
-                return "{}{}{}".format(signal,int(value),unit)
-        elif dp == 3:
-            if unit == 'mHz':
-                unit='Hz'
-                value=value/1000
-            value_str="{:.4f}".format(float(value))
-            if len(unit) == 3:
-                value_str=value_str[0:5]
+    def __read_block(self, trailer=0, header=b''):
+        '''Read an IEEE 488.2 definite-length block (#N<length><data>) from the instrument'''
+        length,prefix=self.__block_length(header)
+        # the trailer rides along with the data in the same sized read and is sliced off
+        total=length+trailer
+        if len(prefix) >= total:
+            return(memoryview(bytearray(prefix))[0:length])
+        return(memoryview(self.__read_sized(total,prefix))[0:length])
+
+    def __reply_chunks(self, size):
+        '''Yield (chunk, end) pieces of the current reply as they arrive'''
+        # with the termination character enabled every read would stop at the end of a CSV row: read sized chunks instead
+        termination=getattr(self.osc, 'read_termination', None)
+        if termination is not None:
+            self.osc.read_termination=None
+        try:
+            visalib=getattr(self.osc, 'visalib', None)
+            if visalib is not None:
+                # pyvisa: read the message piecewise, END marks its last chunk
+                while True:
+                    data, status=visalib.read(self.osc.session, size)
+                    yield(data, status == pyvisa.constants.StatusCode.success)
             else:
-                value_str=value_str[0:6]
-            return "{}{}{}".format(signal,value_str,unit)
-        else:
-            return "{}{}{}".format(signal,int(value),unit)
+                # other transports hand over whatever has arrived, an empty read ending the reply (partial_reads), or the whole reply at once
+                partial=getattr(self.osc, 'partial_reads', False)
+                while True:
+                    data=self.osc.read_raw(size)
+                    yield(data, not data or not partial)
+        finally:
+            if termination is not None:
+                self.osc.read_termination=termination
+
+    def __block_length(self, header=b'', prefix=16):
+        '''Read the header of an IEEE 488.2 definite-length block (#N<length>) from one fixed-size prefix, returning the data length and the data bytes already read'''
+        # every block reply is longer than the prefix: WF? answers at least DAT2,#9<9 digits> plus its trailer
+        data=bytes(header)
+        if len(data) < prefix:
+            data+=self.osc.read_bytes(prefix-len(data))
+        start=data.find(b'#')
+        while start == -1:
+            if len(data) > 64:
+                raise Exception("Error. Block header not found in instrument response.")
+            data+=self.osc.read_bytes(1)
+            start=data.find(b'#')
+        if len(data) < start+2:
+            data+=self.osc.read_bytes(start+2-len(data))
+        digits=int(data[start+1:start+2])
+        if digits == 0:
+            raise Exception("Error. Indefinite-length blocks are not supported.")
+        end=start+2+digits
+        if len(data) < end:
+            data+=self.osc.read_bytes(end-len(data))
+        return(int(data[start+2:end]),data[end:])
+
+    def __copy_sized(self, length, file, prefix=b''):
+        '''Copy exactly length bytes (prefix included) from the instrument to file chunk by chunk'''
+        file.write(prefix)
+        received=len(prefix)
+        while received < length:
+            size=min(length-received,self.osc.chunk_size)
+            try:
+                chunk=self.osc.read_bytes(size, chunk_size=size)
+            except Exception:
+                chunk=b''
+            if not chunk:
+                raise Exception("Error. Block transfer truncated at {} of {} bytes.".format(received,length))
+            file.write(chunk)
+            received+=len(chunk)
+        return(length)
+
+    def __read_sized(self, length, prefix=b''):
+        '''Read exactly length bytes (prefix included) into a preallocated buffer'''
+        block=bytearray(length)
+        view=memoryview(block)
+        received=len(prefix)
+        view[0:received]=prefix
+        while received < length:
+            try:
+                chunk=self.osc.read_bytes(length-received, chunk_size=length-received)
+            except Exception:
+                chunk=b''
+            if not chunk:
+                raise Exception("Error. Block transfer truncated at {} of {} bytes.".format(received,length))
+            view[received:received+len(chunk)]=chunk
+            received+=len(chunk)
+        return(block)
+
+    def __discret_convert(self, value=None, unit='s', dp=2):
+        return(units.format_value(value, unit, dp))
 
     def __indiscret_convert(self, value, unit='s'):
-        unit=unit.upper()
-        mult={'Y':1e24,'Z':1e21,'E':1e18,'P':1e15,'T':1e12,'G':1e9,'M':1e6,'K':1e3,'m':1e-3,'u':1e-6,'n':1e-9,'p':1e-12,'f':1e-15,'a':1e-18,'z':1e-21,'y':1e-24}
-        mixunit=[]
-        mixvalue=[]
-        for mix in mult.keys():
-            mixunit.append(mix+unit)
-            mixvalue.append(mult[mix])
-        multunit=dict(zip(mixunit,mixvalue))
-        for mu in multunit.keys():
-            if value.find(mu) != -1:
-                valueconvert=float(value.split(mu)[0]) * multunit[mu]
-                break
-            valueconvert=value.split(unit)[0]
-        return(float(valueconvert))
+        return(units.parse_value(value, unit))
 
     def __std(self, value):
         valueval=value[0:len(value)-1]
@@ -2689,3 +3562,804 @@ class Oscilloscope(object):
         return(valueval+valueunit)
 
 
+class SocketResource(object):
+    '''A pyvisa-like resource over a raw TCP socket (SCPI port), without the VXI-11 RPC layer.'''
+    # read_raw with read_termination=None returns part of a reply, b'' once it is complete
+    partial_reads = True
+
+    def __init__(self, host, port=5025, timeout=5000, read_termination='\n', write_termination='\n'):
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.chunk_size = 20480
+        # with read_termination=None, this many seconds of silence after a line end end the reply
+        self.idle = 0.1
+        self.__buffer = bytearray()
+        self.__line_end = False
+        self.__socket = socket.create_connection((host, port), timeout=timeout/1000)
+        # commands are small and latency bound: send them immediately
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.timeout = timeout
+
+    @property
+    def timeout(self):
+        return(self.__timeout)
+
+    @timeout.setter
+    def timeout(self, value):
+        self.__timeout = value
+        self.__socket.settimeout(None if value is None else value/1000)
+
+    def write(self, message):
+        return(self.write_raw((message+self.write_termination).encode('ascii')))
+
+    def write_raw(self, message):
+        self.__line_end = False
+        self.__socket.sendall(message)
+        return(len(message))
+
+    def query(self, message):
+        self.write(message)
+        return(self.read())
+
+    def read(self):
+        data = self.read_raw().decode('ascii')
+        if data.endswith(self.read_termination):
+            data = data[0:-len(self.read_termination)]
+        return(data)
+
+    def read_raw(self, size=None):
+        '''Read up to and including the read termination, or with read_termination=None whatever has arrived (up to size bytes)'''
+        if self.read_termination is None:
+            if self.__buffer:
+                data = bytes(self.__buffer[0:size or len(self.__buffer)])
+                del self.__buffer[0:len(data)]
+            elif self.__line_end and not select.select([self.__socket], [], [], self.idle)[0]:
+                # nothing followed the last line: the reply is complete
+                data = b''
+            else:
+                data = self.__recv(size or self.chunk_size)
+            self.__line_end = data.endswith(b'\n')
+            return(data)
+        termination = self.read_termination.encode('ascii')
+        start = 0
+        while True:
+            end = self.__buffer.find(termination, start)
+            if end != -1:
+                end += len(termination)
+                data = bytes(self.__buffer[0:end])
+                del self.__buffer[0:end]
+                return(data)
+            start = max(0, len(self.__buffer)-len(termination)+1)
+            self.__buffer += self.__recv(size or self.chunk_size)
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        '''Read exactly count bytes straight into a preallocated buffer'''
+        data = bytearray(count)
+        view = memoryview(data)
+        received = min(count, len(self.__buffer))
+        view[0:received] = self.__buffer[0:received]
+        del self.__buffer[0:received]
+        while received < count:
+            try:
+                size = self.__socket.recv_into(view[received:], count-received)
+            except socket.timeout:
+                raise Exception("Timeout. Received {} of {} bytes from socket.".format(received, count))
+            if size == 0:
+                raise Exception("Error. Connection closed by instrument.")
+            received += size
+        return(bytes(data))
+
+    def close(self):
+        self.__socket.close()
+
+    def __recv(self, size):
+        try:
+            data = self.__socket.recv(size)
+        except socket.timeout:
+            raise Exception("Timeout. No reply from socket.")
+        if not data:
+            raise Exception("Error. Connection closed by instrument.")
+        return(data)
+
+
+class ResourceProxy(object):
+    '''Wrapper around a pyvisa-like resource; attributes it does not define are read from and written to the wrapped resource.'''
+    def __init__(self, resource):
+        object.__setattr__(self, 'resource', resource)
+
+    def __getattr__(self, name):
+        return(getattr(self.resource, name))
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.resource, name, value)
+
+
+class LockedResource(ResourceProxy):
+    '''Serialise the wrapped resource between threads: each call holds the lock, and so does a whole exchange under Oscilloscope's lock (the same RLock).'''
+    def __init__(self, resource, lock):
+        ResourceProxy.__init__(self, resource)
+        object.__setattr__(self, 'lock', lock)
+
+    def write(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.write(*args, **kwargs))
+
+    def write_raw(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.write_raw(*args, **kwargs))
+
+    def query(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.query(*args, **kwargs))
+
+    def read(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.read(*args, **kwargs))
+
+    def read_raw(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.read_raw(*args, **kwargs))
+
+    def read_bytes(self, *args, **kwargs):
+        with self.lock:
+            return(self.resource.read_bytes(*args, **kwargs))
+
+
+class BatchReply(object):
+    '''Placeholder for the reply of a deferred batch query, filled in when the batch is flushed.'''
+    __slots__ = ('query', 'value')
+    def __init__(self, query):
+        self.query = query
+        self.value = None
+
+    def __repr__(self):
+        return("BatchReply({!r}={!r})".format(self.query, self.value))
+
+
+class CommandBatch(ResourceProxy):
+    '''Queue writes and deferred queries and send them as semicolon-joined messages of at most max_length characters.'''
+    def __init__(self, resource, max_length=512):
+        ResourceProxy.__init__(self, resource)
+        object.__setattr__(self, 'max_length', max_length)
+        object.__setattr__(self, 'pending', [])
+
+    def write(self, message):
+        '''Queue a command'''
+        if '?' in message:
+            # a query whose reply is read back raw must not share a message with deferred queries
+            self.flush()
+        self.pending.append((message, None))
+        return(len(message))
+
+    def defer(self, message):
+        '''Queue a query and return a BatchReply holding its value after the flush'''
+        reply = BatchReply(message)
+        self.pending.append((message, reply))
+        return(reply)
+
+    def query(self, message):
+        '''Send queued commands together with this query and return its reply'''
+        reply = self.defer(message)
+        self.flush()
+        return(reply.value)
+
+    def flush(self):
+        '''Send every queued command and distribute the replies'''
+        while self.pending:
+            length = len(self.pending[0][0])
+            count = 1
+            while count < len(self.pending) and length + 1 + len(self.pending[count][0]) <= self.max_length:
+                length += 1 + len(self.pending[count][0])
+                count += 1
+            group = self.pending[0:count]
+            del self.pending[0:count]
+            message = ";".join(command for command, reply in group)
+            replies = [reply for command, reply in group if reply is not None]
+            if replies:
+                values = self.resource.query(message).split(';')
+                if len(values) != len(replies):
+                    raise Exception("Error. Batch expected {} replies and received {}.".format(len(replies), len(values)))
+                for reply, value in zip(replies, values):
+                    reply.value = value
+            else:
+                self.resource.write(message)
+
+    def read_raw(self, *args, **kwargs):
+        self.flush()
+        return(self.resource.read_raw(*args, **kwargs))
+
+    def read_bytes(self, *args, **kwargs):
+        self.flush()
+        return(self.resource.read_bytes(*args, **kwargs))
+
+    def write_raw(self, message):
+        self.flush()
+        return(self.resource.write_raw(message))
+
+
+class LatencyHistogram(object):
+    '''Streaming latency histogram with log-spaced buckets (20 per decade from 1 us to 100 s) for percentile estimates.'''
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+    PER_DECADE = 20
+    LOWEST = 1e-6
+    SIZE = 8*20+2
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0]*LatencyHistogram.SIZE
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        if seconds < LatencyHistogram.LOWEST:
+            index = 0
+        else:
+            index = min(LatencyHistogram.SIZE-1, int(math.log10(seconds/LatencyHistogram.LOWEST)*LatencyHistogram.PER_DECADE)+1)
+        self.buckets[index] += 1
+
+    @staticmethod
+    def bound(index):
+        '''Upper edge in seconds of a bucket'''
+        return(LatencyHistogram.LOWEST*10**(index/LatencyHistogram.PER_DECADE))
+
+    def percentile(self, p):
+        '''Estimate of the p-th percentile (upper edge of the bucket holding it, within min and max)'''
+        if not self.count:
+            return(None)
+        rank = p/100*self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return(min(self.max, max(self.min, LatencyHistogram.bound(index))))
+        return(self.max)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        self.buckets = [mine+theirs for mine, theirs in zip(self.buckets, other.buckets)]
+
+
+class CommandStats(object):
+    '''Per-mnemonic counters and latency histograms of instrument transactions (a command plus the reads of its reply).'''
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__current = None
+
+    @staticmethod
+    def mnemonic(message):
+        '''Command headers of a message without channel prefixes, e.g. WFSU;WF? for "WFSU SP,1,...;C1:WF? DAT2"'''
+        if type(message) is not str:
+            message = bytes(message[0:64]).decode('ascii', 'replace')
+        return(";".join(re.sub(r'^(C\d+|EX5?):', '', part.strip().split(' ')[0]).upper() for part in message.split(';') if part.strip()))
+
+    def command(self, message, sent, elapsed, received=0):
+        '''Start a transaction for a written command (query replies count as received)'''
+        with self.__lock:
+            self.__close()
+            self.__current = [CommandStats.mnemonic(message), sent, received, elapsed, 0.0]
+
+    def reply(self, received, elapsed):
+        '''Add a read to the current transaction'''
+        with self.__lock:
+            if self.__current is None:
+                self.__current = ['(READ)', 0, 0, 0.0, 0.0]
+            self.__current[2] += received
+            self.__current[3] += elapsed
+
+    def sleep(self, seconds):
+        '''Add pacing sleep to the current transaction'''
+        with self.__lock:
+            if self.__current is not None:
+                self.__current[4] += seconds
+
+    def __close(self):
+        if self.__current is not None:
+            name, sent, received, elapsed, sleep = self.__current
+            entry = self.__entries.get(name)
+            if entry is None:
+                entry = self.__entries[name] = {'count': 0, 'bytes_out': 0, 'bytes_in': 0, 'sleep': 0.0, 'latency': LatencyHistogram()}
+            entry['count'] += 1
+            entry['bytes_out'] += sent
+            entry['bytes_in'] += received
+            entry['sleep'] += sleep
+            entry['latency'].add(elapsed)
+            self.__current = None
+
+    def snapshot(self, reset=False, buckets=False):
+        '''Stats per mnemonic as plain dicts (JSON-serialisable); buckets=True adds the histogram counts for merging elsewhere'''
+        with self.__lock:
+            self.__close()
+            results = {}
+            for name, entry in self.__entries.items():
+                latency = entry['latency']
+                results[name] = {'count': entry['count'], 'bytes_out': entry['bytes_out'], 'bytes_in': entry['bytes_in'],
+                                 'time': latency.total, 'sleep': entry['sleep'], 'mean': latency.total/latency.count,
+                                 'min': latency.min, 'p50': latency.percentile(50), 'p90': latency.percentile(90),
+                                 'p99': latency.percentile(99), 'max': latency.max}
+                if buckets:
+                    results[name]['buckets'] = {"{:.3g}".format(LatencyHistogram.bound(index)): count for index, count in enumerate(latency.buckets) if count}
+            if reset:
+                self.__entries = {}
+            return(results)
+
+
+class InstrumentedResource(ResourceProxy):
+    '''Time every write, query and read on the wrapped resource into a CommandStats.'''
+    # replies are read through read_raw, never straight from visalib, so that chunked transfers are timed too
+    visalib = None
+    def __init__(self, resource, stats):
+        ResourceProxy.__init__(self, resource)
+        object.__setattr__(self, 'stats', stats)
+
+    def write(self, message):
+        start = time.perf_counter()
+        result = self.resource.write(message)
+        self.stats.command(message, len(message), time.perf_counter()-start)
+        return(result)
+
+    def write_raw(self, message):
+        start = time.perf_counter()
+        result = self.resource.write_raw(message)
+        self.stats.command(message, len(message), time.perf_counter()-start)
+        return(result)
+
+    def query(self, message):
+        start = time.perf_counter()
+        reply = self.resource.query(message)
+        self.stats.command(message, len(message), time.perf_counter()-start, len(reply))
+        return(reply)
+
+    def read(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read(*args, **kwargs)
+        self.stats.reply(len(data), time.perf_counter()-start)
+        return(data)
+
+    def read_raw(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read_raw(*args, **kwargs)
+        self.stats.reply(len(data), time.perf_counter()-start)
+        return(data)
+
+    def read_bytes(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read_bytes(*args, **kwargs)
+        self.stats.reply(len(data), time.perf_counter()-start)
+        return(data)
+
+
+# Trace files: TRACE_MAGIC, then records of TRACE_RECORD (kind, start, duration, payload length) each followed by the payload.
+# Kinds: S session start, W write, w write_raw, T text reply (read/query), R raw reply (read_raw/read_bytes).
+TRACE_MAGIC = b'BKTRACE1'
+TRACE_RECORD = struct.Struct('<cddI')
+
+def read_trace(path):
+    '''Iterate over the (kind, start, duration, payload) records of a trace file'''
+    with open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise Exception("Error. {} is not a trace file.".format(path))
+        while True:
+            header = f.read(TRACE_RECORD.size)
+            if len(header) < TRACE_RECORD.size:
+                return
+            kind, start, duration, length = TRACE_RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                # a record cut short by a crash ends the trace
+                return
+            yield((kind.decode('ascii'), start, duration, payload))
+
+
+class TraceRecorder(ResourceProxy):
+    '''Append every request and reply on the wrapped resource, binary blocks included, to a trace file.'''
+    # replies are read through read_raw, never straight from visalib, and acquisitions are polled
+    # rather than signalled by SRQ, so that everything is recorded and replays the same way
+    visalib = None
+    wait_for_srq = None
+    enable_event = None
+
+    def __init__(self, resource, path):
+        ResourceProxy.__init__(self, resource)
+        trace = open(path, 'ab')
+        if trace.tell() == 0:
+            trace.write(TRACE_MAGIC)
+        object.__setattr__(self, 'trace', trace)
+        object.__setattr__(self, 'origin', time.perf_counter())
+        self.__record('S', self.origin, time.strftime('%Y-%m-%dT%H:%M:%S').encode('ascii'))
+
+    def __record(self, kind, start, payload):
+        end = time.perf_counter()
+        self.trace.write(TRACE_RECORD.pack(kind.encode('ascii'), start-self.origin, end-start, len(payload)))
+        self.trace.write(payload)
+        self.trace.flush()
+
+    def close_trace(self):
+        self.trace.close()
+
+    def write(self, message):
+        start = time.perf_counter()
+        result = self.resource.write(message)
+        self.__record('W', start, message.encode('ascii'))
+        return(result)
+
+    def write_raw(self, message):
+        start = time.perf_counter()
+        result = self.resource.write_raw(message)
+        self.__record('w', start, bytes(message))
+        return(result)
+
+    def query(self, message):
+        self.write(message)
+        return(self.read())
+
+    def read(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read(*args, **kwargs)
+        self.__record('T', start, data.encode('ascii'))
+        return(data)
+
+    def read_raw(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read_raw(*args, **kwargs)
+        self.__record('R', start, bytes(data))
+        return(data)
+
+    def read_bytes(self, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.resource.read_bytes(*args, **kwargs)
+        self.__record('R', start, bytes(data))
+        return(data)
+
+
+class ReplayResource(object):
+    '''A pyvisa-like resource answering from a recorded trace: speed=1.0 keeps the recorded instrument timing, 10.0 is ten times faster, None does not wait.'''
+    partial_reads = True
+
+    def __init__(self, path, speed=None, strict=True, session=0):
+        self.speed = speed
+        self.strict = strict
+        self.chunk_size = 20480
+        self.timeout = 5000
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.__buffer = b''
+        self.__peeked = None
+        self.__events = read_trace(path)
+        # skip to the requested recording session
+        sessions = -1
+        for kind, start, duration, payload in self.__events:
+            if kind == 'S':
+                sessions += 1
+                if sessions == session:
+                    break
+        else:
+            raise Exception("Error. Trace {} has no session {}.".format(path, session))
+
+    def __pull(self):
+        record, self.__peeked = self.__peeked, None
+        return(record or next(self.__events, None))
+
+    def __next(self, kinds, request):
+        record = self.__pull()
+        if record is not None and record[0] != 'S':
+            kind, start, duration, payload = record
+            if kind not in kinds:
+                raise Exception("Error. Trace diverged: {!r} does not match recorded {} record {!r}.".format(request, kind, payload[0:64]))
+            if self.speed:
+                time.sleep(duration/self.speed)
+            return(kind, payload)
+        raise Exception("Error. Trace ended before {!r}.".format(request))
+
+    def write(self, message):
+        kind, payload = self.__next('W', message)
+        if self.strict and payload.decode('ascii') != message:
+            raise Exception("Error. Trace diverged: sent {!r}, recorded {!r}.".format(message, payload.decode('ascii')))
+        return(len(message))
+
+    def write_raw(self, message):
+        kind, payload = self.__next('Ww', message[0:64])
+        if self.strict and payload.rstrip(b'\n') != bytes(message).rstrip(b'\n'):
+            raise Exception("Error. Trace diverged: sent {!r}, recorded {!r}.".format(message[0:64], payload[0:64]))
+        return(len(message))
+
+    def query(self, message):
+        self.write(message)
+        return(self.read())
+
+    def __reply(self):
+        '''Bytes of the next recorded reply, text replies with their termination'''
+        kind, payload = self.__next('TR', 'read')
+        if kind == 'T':
+            payload += self.read_termination.encode('ascii')
+        return(payload)
+
+    def read(self):
+        data = self.read_raw().decode('ascii')
+        if data.endswith(self.read_termination):
+            data = data[0:-len(self.read_termination)]
+        return(data)
+
+    def read_raw(self, size=None):
+        if self.read_termination is None and not self.__buffer:
+            # a reply read in chunks ends where the recording has no further read
+            self.__peeked = self.__pull()
+            if self.__peeked is None or self.__peeked[0] != 'R':
+                return(b'')
+        data = self.__buffer or self.__reply()
+        self.__buffer = b''
+        return(data)
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        data = bytearray(self.__buffer)
+        while len(data) < count:
+            data += self.__reply()
+        self.__buffer = bytes(data[count:])
+        return(bytes(data[0:count]))
+
+    def close(self):
+        self.__events.close()
+
+
+class AsyncSocketResource(object):
+    '''SocketResource on asyncio streams (asyncio.open_connection): every write and read is a coroutine.'''
+    partial_reads = True
+
+    def __init__(self, reader, writer, timeout=5000, read_termination='\n', write_termination='\n'):
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.chunk_size = 20480
+        self.timeout = timeout
+        self.idle = 0.1
+        self.__line_end = False
+        self.__reader = reader
+        self.__writer = writer
+
+    @classmethod
+    async def open(cls, host, port=5025, timeout=5000):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, limit=1<<20), timeout/1000)
+        # commands are small and latency bound: send them immediately
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return(cls(reader, writer, timeout))
+
+    async def write(self, message):
+        return(await self.write_raw((message+self.write_termination).encode('ascii')))
+
+    async def write_raw(self, message):
+        self.__line_end = False
+        self.__writer.write(message)
+        await self.__writer.drain()
+        return(len(message))
+
+    async def query(self, message):
+        await self.write(message)
+        return(await self.read())
+
+    async def read(self):
+        data = (await self.read_raw()).decode('ascii')
+        if data.endswith(self.read_termination):
+            data = data[0:-len(self.read_termination)]
+        return(data)
+
+    async def read_raw(self, size=None):
+        '''Read up to and including the read termination, or with read_termination=None whatever has arrived (up to size bytes)'''
+        if self.read_termination is None:
+            if self.__line_end:
+                try:
+                    data = await asyncio.wait_for(self.__reader.read(size or self.chunk_size), self.idle)
+                except asyncio.TimeoutError:
+                    # nothing followed the last line: the reply is complete
+                    self.__line_end = False
+                    return(b'')
+            else:
+                data = await self.__wait(self.__reader.read(size or self.chunk_size))
+            if not data:
+                raise Exception("Error. Connection closed by instrument.")
+            self.__line_end = data.endswith(b'\n')
+            return(data)
+        return(await self.__wait(self.__reader.readuntil(self.read_termination.encode('ascii'))))
+
+    async def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        return(await self.__wait(self.__reader.readexactly(count)))
+
+    async def close(self):
+        self.__writer.close()
+        await self.__writer.wait_closed()
+
+    async def __wait(self, read):
+        try:
+            return(await asyncio.wait_for(read, None if self.timeout is None else self.timeout/1000))
+        except asyncio.TimeoutError:
+            raise Exception("Timeout. No reply from socket.")
+        except asyncio.IncompleteReadError:
+            raise Exception("Error. Connection closed by instrument.")
+
+
+class LoopResource(ResourceProxy):
+    '''Blocking pyvisa-like face of an AsyncSocketResource for a worker thread: each call runs as a coroutine on the event loop.'''
+    def __init__(self, resource, loop):
+        ResourceProxy.__init__(self, resource)
+        object.__setattr__(self, 'loop', loop)
+
+    def __run(self, coroutine):
+        return(asyncio.run_coroutine_threadsafe(coroutine, self.loop).result())
+
+    def write(self, message):
+        return(self.__run(self.resource.write(message)))
+
+    def write_raw(self, message):
+        return(self.__run(self.resource.write_raw(message)))
+
+    def query(self, message):
+        return(self.__run(self.resource.query(message)))
+
+    def read(self):
+        return(self.__run(self.resource.read()))
+
+    def read_raw(self, size=None):
+        return(self.__run(self.resource.read_raw(size)))
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        return(self.__run(self.resource.read_bytes(count)))
+
+    def close(self):
+        return(self.__run(self.resource.close()))
+
+
+class AsyncOscilloscope(object):
+    '''An asyncio client with the same command set as Oscilloscope, one awaitable coroutine per command (open() for transport='socket' does the I/O on the event loop).'''
+    def __init__(self, scope, executor=None, pacing=None):
+        self.scope = scope
+        # the command logic of Oscilloscope runs in one worker per instrument, keeping its commands in order;
+        # with an AsyncSocketResource the worker only hands each exchange to the event loop and waits for it
+        self.__executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # pacing awaited here rather than slept in the worker (None: left to the scope)
+        self.__pacing = pacing
+
+    @classmethod
+    async def open(cls, ip, pacing='fixed', **kwargs):
+        '''Open a connection without blocking the event loop; transport='socket' runs on asyncio.open_connection with awaited pacing'''
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        if str(kwargs.get('transport')).lower() != 'socket':
+            scope = await loop.run_in_executor(executor, functools.partial(Oscilloscope, ip, pacing=pacing, **kwargs))
+            return(cls(scope, executor))
+        resource = await AsyncSocketResource.open(ip, kwargs.pop('port', 5025))
+        kwargs['transport'] = LoopResource(resource, loop)
+        try:
+            scope = await loop.run_in_executor(executor, functools.partial(Oscilloscope, ip, pacing='none', **kwargs))
+        except Exception:
+            await resource.close()
+            executor.shutdown(wait=False)
+            raise
+        client = cls(scope, executor)
+        await client.pacing(pacing)
+        return(client)
+
+    async def pacing(self, mode=None):
+        '''Set pacing policy used after instrument transactions (awaited with asyncio.sleep on the event loop transport)'''
+        if not isinstance(self.scope.transport, LoopResource):
+            return(await self.__run(self.scope.pacing, mode))
+        if mode is None:
+            return(self.__pacing)
+        # ADAPTIVE only syncs with *OPC? in the scope; FIXED sleeps are awaited here between commands
+        result = await self.__run(self.scope.pacing, mode)
+        self.__pacing = mode.upper()
+        await self.__run(self.scope.pacing, 'adaptive' if self.__pacing == 'ADAPTIVE' else 'none')
+        return(result)
+
+    async def close(self):
+        '''Disconnect and release the worker'''
+        try:
+            return(await self.__run(self.scope.disconnect))
+        finally:
+            self.__executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def __run(self, function, *args, **kwargs):
+        return(await asyncio.get_running_loop().run_in_executor(self.__executor, functools.partial(function, *args, **kwargs)))
+
+    async def __pace(self):
+        if self.__pacing == 'FIXED':
+            await asyncio.sleep(self.scope.delay)
+
+    def __getattr__(self, name):
+        attr = getattr(self.scope, name)
+        if not callable(attr):
+            return(attr)
+        @functools.wraps(attr)
+        async def command(*args, **kwargs):
+            result = await self.__run(attr, *args, **kwargs)
+            await self.__pace()
+            return(result)
+        return(command)
+
+    async def stream(self, *args, **kwargs):
+        '''Asynchronous iterator over Oscilloscope.stream() frames'''
+        frames = await self.__run(self.scope.stream, *args, **kwargs)
+        try:
+            while True:
+                frame = await self.__run(next, frames, None)
+                if frame is None:
+                    break
+                yield(frame)
+        finally:
+            await self.__run(frames.close)
+
+
+class OscilloscopeFleet(object):
+    '''Parallel control of several oscilloscopes; results are dicts keyed by IP, failed units map to their exception.'''
+    def __init__(self, ips, **kwargs):
+        self.scopes = {}
+        self.errors = {}
+        # one worker per instrument: commands to a unit stay ordered, units run side by side
+        self.__executors = {ip: concurrent.futures.ThreadPoolExecutor(max_workers=1) for ip in ips}
+        connections = {ip: executor.submit(Oscilloscope, ip, **kwargs) for ip, executor in self.__executors.items()}
+        for ip, result in OscilloscopeFleet.__gather(connections).items():
+            if isinstance(result, Exception):
+                self.errors[ip] = result
+            else:
+                self.scopes[ip] = result
+
+    def broadcast(self, command, *args, **kwargs):
+        '''Run the same command with the same arguments on every connected unit'''
+        futures = {ip: self.__executors[ip].submit(getattr(scope, command), *args, **kwargs) for ip, scope in self.scopes.items()}
+        return(self.__record(OscilloscopeFleet.__gather(futures)))
+
+    def map(self, command, arguments):
+        '''Run a command on each unit with its own arguments -> arguments={ip: (args...)}'''
+        futures = {}
+        for ip, args in arguments.items():
+            if ip not in self.scopes:
+                raise Exception("Invalid input for fleet map -> IP {} is not connected".format(ip))
+            if not isinstance(args, tuple):
+                args = (args,)
+            futures[ip] = self.__executors[ip].submit(getattr(self.scopes[ip], command), *args)
+        return(self.__record(OscilloscopeFleet.__gather(futures)))
+
+    def disconnect(self):
+        '''Close every connection and release the workers'''
+        results = self.broadcast('disconnect')
+        for executor in self.__executors.values():
+            executor.shutdown(wait=False)
+        return(results)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return(functools.partial(self.broadcast, name))
+
+    def __record(self, results):
+        for ip, result in results.items():
+            if isinstance(result, Exception):
+                self.errors[ip] = result
+        return(results)
+
+    @staticmethod
+    def __gather(futures):
+        results = {}
+        for ip, future in futures.items():
+            try:
+                results[ip] = future.result()
+            except Exception as error:
+                results[ip] = error
+        return(results)
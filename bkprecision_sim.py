@@ -0,0 +1,313 @@
+import time, re, math, socketserver, threading
+import pyvisa
+import numpy as np
+class SimulatedOscilloscope(object):
+    '''An in-process stand-in for a 2190E, usable as Oscilloscope(ip, transport=SimulatedOscilloscope()).'''
+    def __init__(self, samples=14000, latency=0.0, bandwidth=None, screen=(800,480), frequency=1e3, amplitude=(1.0,0.5), noise=0.01):
+        self.samples = samples
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.screen = screen
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.noise = noise
+        self.chunk_size = 20480
+        self.timeout = 5000
+        self.nchannels = len(amplitude)
+        self.__rng = np.random.default_rng(0)
+        self.__replies = []
+        self.__armed_at = None
+        self.__acquired = False
+        self.reset()
+
+    def reset(self):
+        '''Restore the power-on panel settings'''
+        self.state = {'CHDR':'OFF','TDIV':1e-3,'TRMD':'AUTO','ACQW':'SAMPLING','AVGA':16,'ILVD':'OFF','MENU':'ON',
+                      'WFSU':{'SP':1,'NP':0,'FP':0,'SN':0},'*OPC':1,'*ESE':0,'*SRE':0,'INE':0}
+        for channel in range(1,(self.nchannels+1)):
+            self.state.update({'C{}:VDIV'.format(channel):0.5,'C{}:OFST'.format(channel):0.0,'C{}:TRA'.format(channel):'ON',
+                               'C{}:ATTN'.format(channel):1,'C{}:CPL'.format(channel):'D1M','C{}:BWL'.format(channel):'OFF',
+                               'C{}:UNIT'.format(channel):'V','C{}:TRLV'.format(channel):0.0})
+
+    # TRANSPORT
+    def write(self, message):
+        '''Execute a (possibly semicolon-joined) message and queue its replies'''
+        self.__delay(len(message))
+        replies=[]
+        for command in message.strip().split(';'):
+            if command:
+                reply=self.__execute(command.strip())
+                if reply is not None:
+                    replies.append(reply)
+        if replies:
+            if all(type(reply) is str for reply in replies):
+                self.__replies.append(';'.join(replies).encode('ascii')+b'\n')
+            else:
+                for reply in replies:
+                    self.__replies.append(reply if type(reply) is bytes else reply.encode('ascii')+b'\n')
+        return(len(message))
+
+    def write_raw(self, message):
+        command, _, data = bytes(message).partition(b' ')
+        if command.upper() == b'PNSU':
+            self.state['PNSU']=data
+        return(len(message))
+
+    def query(self, message):
+        self.write(message)
+        return(self.read())
+
+    def read(self):
+        return(self.read_raw().decode('ascii').rstrip('\n'))
+
+    def read_raw(self, size=None):
+        '''Read the remainder of the current reply message'''
+        reply=self.__next_reply()
+        self.__replies.pop(0)
+        self.__delay(len(reply))
+        return(bytes(reply))
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        '''Read exactly count bytes of the current reply message'''
+        reply=self.__next_reply()
+        if len(reply) < count:
+            raise Exception("Timeout. Simulated reply has {} bytes, {} requested.".format(len(reply),count))
+        data=reply[0:count]
+        if len(reply) == count:
+            self.__replies.pop(0)
+        else:
+            self.__replies[0]=reply[count:]
+        self.__delay(count)
+        return(bytes(data))
+
+    def wait_for_srq(self, timeout=25000):
+        '''Block until the service request of a completed acquisition (INE and *SRE bit 0 set)'''
+        enabled=int(self.state['INE']) & 1 and int(self.state['*SRE']) & 1
+        if enabled and self.__armed_at is not None:
+            remaining=self.__armed_at+self.__acquisition_time()-time.perf_counter()
+            if timeout is None or remaining <= timeout/1000:
+                time.sleep(max(0,remaining))
+                return
+        if timeout is not None:
+            time.sleep(timeout/1000)
+        raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+
+    def close(self):
+        self.__replies=[]
+
+    def take_replies(self):
+        '''Remove and return every queued reply message, as a socket server would send them'''
+        replies, self.__replies=self.__replies, []
+        for reply in replies:
+            self.__delay(len(reply))
+        return(replies)
+
+    def __next_reply(self):
+        if not self.__replies:
+            raise Exception("Timeout. No simulated reply pending.")
+        return(self.__replies[0])
+
+    def __delay(self, size):
+        pause=self.latency
+        if self.bandwidth:
+            pause+=size/self.bandwidth
+        if pause > 0:
+            time.sleep(pause)
+
+    # COMMAND SET
+    def __execute(self, command):
+        match=re.match(r'^(?:(C\d|EX5?):)?(\*?[A-Z_]+\??)\s*(.*)$', command, re.IGNORECASE)
+        if match is None:
+            return(None)
+        prefix, mnemonic, args = match.group(1), match.group(2).upper(), match.group(3).strip()
+        query=mnemonic.endswith('?')
+        mnemonic=mnemonic.rstrip('?')
+        key=mnemonic if prefix is None else "{}:{}".format(prefix.upper(),mnemonic)
+        handler=getattr(self, '_SimulatedOscilloscope__cmd_{}'.format(mnemonic.lstrip('*').lower()), None)
+        if handler is not None:
+            return(handler(prefix, args, query))
+        if query:
+            return(self.__format(self.state.get(key,'OFF')))
+        value=self.__number(args)
+        if key in ('TDIV',) or key.endswith(':VDIV') or key.endswith(':OFST'):
+            self.state[key]=self.__number(args, engineering=True)
+        else:
+            self.state[key]=args.upper() if value is None else value
+        return(None)
+
+    def __cmd_idn(self, prefix, args, query):
+        return("BK Precision,2190E,SIMULATOR,1.0")
+
+    def __cmd_opc(self, prefix, args, query):
+        return("1") if query else None
+
+    def __cmd_wfsu(self, prefix, args, query):
+        if query:
+            return(",".join("{},{}".format(name,value) for name,value in self.state['WFSU'].items()))
+        fields=[field.strip() for field in args.split(',')]
+        for name,value in zip(fields[0::2],fields[1::2]):
+            self.state['WFSU'][name.upper()]=int(float(value))
+        return(None)
+
+    def __cmd_sanu(self, prefix, args, query):
+        return("{}".format(self.samples))
+
+    def __cmd_sara(self, prefix, args, query):
+        rate=self.samples/(self.state['TDIV']*14)
+        for unit,scale in (('G',1e9),('M',1e6)):
+            if rate >= scale:
+                return("{:.2f}{}Sa/s".format(rate/scale,unit))
+        return("{:.2f}KSa/s".format(rate/1e3))
+
+    def __cmd_arm(self, prefix, args, query):
+        self.__armed_at=time.perf_counter()
+        self.__acquired=False
+        return(None)
+
+    def __cmd_wait(self, prefix, args, query):
+        if self.__armed_at is not None:
+            remaining=self.__armed_at+self.__acquisition_time()-time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+        return(None)
+
+    def __cmd_inr(self, prefix, args, query):
+        # bit 0: new signal acquired; INR? is read-and-clear
+        if self.__armed_at is not None and time.perf_counter() >= self.__armed_at+self.__acquisition_time():
+            self.__armed_at=None
+            self.__acquired=True
+        value=1 if self.__acquired else 0
+        self.__acquired=False
+        return("{}".format(value))
+
+    def __cmd_stop(self, prefix, args, query):
+        if self.state['TRMD'] != 'STOP':
+            self.state['RUN']=self.state['TRMD']
+            self.state['TRMD']='STOP'
+        return(None)
+
+    def __cmd_run(self, prefix, args, query):
+        if self.state['TRMD'] == 'STOP':
+            self.state['TRMD']=self.state.get('RUN','AUTO')
+        return(None)
+
+    def __cmd_rst(self, prefix, args, query):
+        self.reset()
+        return(None)
+
+    def __cmd_wf(self, prefix, args, query):
+        data=self.__codes(int(prefix[1:])).tobytes()
+        return(b"DAT2,#9"+"{:09d}".format(len(data)).encode('ascii')+data+b"\n\n")
+
+    def __cmd_pava(self, prefix, args, query):
+        frequency=self.frequency
+        amplitude=self.amplitude[int(prefix[1:])-1]
+        values={'PKPK':2*amplitude,'MAX':amplitude,'MIN':-amplitude,'AMPL':2*amplitude,'TOP':amplitude,'BASE':-amplitude,
+                'CMEAN':0.0,'MEAN':0.0,'RMS':amplitude/math.sqrt(2),'CRMS':amplitude/math.sqrt(2),
+                'OVSN':0.0,'FPRE':0.0,'OVSP':0.0,'RPRE':0.0,'FREQ':frequency,'PER':1/frequency,
+                'PWID':0.5/frequency,'NWID':0.5/frequency,'RISE':0.2952/frequency,'FALL':0.2952/frequency,
+                'WID':14*self.state['TDIV'],'DUTY':50.0,'NDUTY':50.0}
+        if args.upper() != 'ALL':
+            values={args.upper():values.get(args.upper(),0.0)}
+        return(",".join("{},{:.2E}".format(name,value) for name,value in values.items()))
+
+    def __cmd_scdp(self, prefix, args, query):
+        return(self.__bitmap())
+
+    def __cmd_gcsv(self, prefix, args, query):
+        channels=[channel for channel in range(1,(self.nchannels+1)) if self.state['C{}:TRA'.format(channel)] == 'ON']
+        time_value, volts=self.__volts(channels)
+        lines=["Record Length,Analog:{}".format(len(time_value)),
+               "Sample Interval,{:.6E}".format(time_value[1]-time_value[0]),
+               "Vertical Units,V","Horizontal Units,S",
+               ",".join(["Second"]+["CH{}".format(channel) for channel in channels])]
+        rows=np.column_stack([time_value]+list(volts))
+        lines.extend(",".join("{:.6E}".format(value) for value in row) for row in rows)
+        return("\n".join(lines))
+
+    # SIGNAL MODEL
+    def __acquisition_time(self):
+        return(self.state['TDIV']*14)
+
+    def __volts(self, channels):
+        setup=self.state['WFSU']
+        step=max(1,setup['SP'])
+        first=min(setup['FP'],self.samples)
+        count=(self.samples-first+step-1)//step
+        if setup['NP']:
+            count=min(count,setup['NP'])
+        index=first+np.arange(count)*step
+        sara=self.samples/(self.state['TDIV']*14)
+        time_value=-(self.state['TDIV']*14/2)+index/sara
+        volts=[]
+        for channel in channels:
+            phase=(channel-1)*math.pi/2
+            signal=self.amplitude[channel-1]*np.sin(2*math.pi*self.frequency*time_value+phase)
+            volts.append(signal+self.__rng.normal(0,self.noise,count))
+        return(time_value, volts)
+
+    def __codes(self, channel):
+        time_value, (volts,)=self.__volts([channel])
+        codes=np.rint((volts+self.state['C{}:OFST'.format(channel)])*25/self.state['C{}:VDIV'.format(channel)])
+        return(np.clip(codes,-128,127).astype(np.int8))
+
+    def __bitmap(self):
+        width, height=self.screen
+        pixels=np.zeros((height,width,3),dtype=np.uint8)
+        pixels[::height//8,:]=(80,80,80)
+        pixels[:,::width//14]=(80,80,80)
+        for channel, colour in zip(range(1,(self.nchannels+1)),((0,255,255),(255,0,255))):
+            if self.state['C{}:TRA'.format(channel)] != 'ON':
+                continue
+            codes=self.__codes(channel).astype(int)
+            columns=np.linspace(0,len(codes)-1,width).astype(int)
+            rows=np.clip(height//2-codes[columns]*(height//8)//25,0,height-1)
+            pixels[rows,np.arange(width)]=colour
+        stride=(width*3+3)//4*4
+        body=np.zeros((height,stride),dtype=np.uint8)
+        body[:,0:width*3]=pixels[::-1].reshape(height,width*3)
+        header=b'BM'+(54+body.size).to_bytes(4,'little')+bytes(4)+(54).to_bytes(4,'little')
+        info=(40).to_bytes(4,'little')+width.to_bytes(4,'little')+height.to_bytes(4,'little')+(1).to_bytes(2,'little')+(24).to_bytes(2,'little')+bytes(24)
+        return(header+info+body.tobytes())
+
+    # UTILS FUNCTIONS
+    @staticmethod
+    def __format(value):
+        if type(value) is float:
+            return("{:.2E}".format(value))
+        return("{}".format(value))
+
+    @staticmethod
+    def __number(args, engineering=False):
+        prefixes={'G':1e9,'M':1e6,'K':1e3,'':1.0,'m':1e-3,'u':1e-6,'n':1e-9}
+        match=re.match(r'^([-+]?[0-9.]+(?:[eE][-+]?\d+)?)\s*([GMKmun]?)', args)
+        if match is None:
+            return(None)
+        value=float(match.group(1))
+        if engineering:
+            prefix=match.group(2)
+            if prefix == 'M' and args[match.end():].upper().startswith('V'):
+                prefix='m'
+            return(value*prefixes[prefix])
+        if match.end() != len(args):
+            return(None)
+        return(int(value) if value.is_integer() and '.' not in match.group(1) else value)
+
+
+def serve(simulator=None, host='127.0.0.1', port=0):
+    '''Serve a simulator on a TCP port like the instrument's raw SCPI socket; returns the running server'''
+    simulator = simulator or SimulatedOscilloscope()
+    lock = threading.Lock()
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                with lock:
+                    simulator.write(line.decode('ascii', 'replace').rstrip('\r\n'))
+                    replies=simulator.take_replies()
+                for reply in replies:
+                    self.wfile.write(reply)
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server)
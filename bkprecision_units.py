@@ -0,0 +1,143 @@
+'''Engineering-unit formatting and parsing ("1.50ms" <-> 0.0015) for bkprecision, for single values and whole arrays.'''
+import math, re
+import numpy as np
+
+# SI prefixes by power of ten, with the factor applied when formatting into that prefix
+PREFIXES={24:('Y',1e-24),21:('Z',1e-21),18:('E',1e-18),15:('P',1e-15),12:('T',1e-12),9:('G',1e-9),6:('M',1e-6),3:('K',1e-3),0:('',1e0),
+          -3:('m',1e3),-6:('u',1e6),-9:('n',1e9),-12:('p',1e12),-15:('f',1e15),-18:('a',1e18),-21:('z',1e21),-24:('y',1e24)}
+MULTIPLIERS={'Y':1e24,'Z':1e21,'E':1e18,'P':1e15,'T':1e12,'G':1e9,'M':1e6,'K':1e3,'k':1e3,'m':1e-3,'u':1e-6,'n':1e-9,'p':1e-12,'f':1e-15,'a':1e-18,'z':1e-21,'y':1e-24}
+
+# number, optional SI prefix (k or K for kilo), optional unit
+_NUMBER=r'([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)[ \t]*([YZEPTGMKkmunpfazy]?)([A-Za-z%]*)'
+_QUANTITY=re.compile(r'^[ \t]*'+_NUMBER+r'[ \t]*$')
+# what follows the number (prefix, unit and blanks): parse_values strips it with str.rstrip and parses each distinct text once
+_TAIL='ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz% \t'
+_SUFFIX=re.compile(r'^[ \t]*([YZEPTGMKkmunpfazy]?)([A-Za-z%]*)[ \t]*$')
+
+# lookup tables indexed by prefix position (1e-24..1e24 in steps of 1e3)
+_EXPONENTS=range(-24,27,3)
+_THRESHOLDS=np.array([1e-24,1e-21,1e-18,1e-15,1e-12,1e-9,1e-6,1e-3,1e-0,1e3,1e6,1e9,1e12,1e15,1e18,1e21,1e24])
+_PREFIX_BY_INDEX=np.array([PREFIXES[exponent][0] for exponent in _EXPONENTS])
+_SCALE_BY_INDEX=np.array([PREFIXES[exponent][1] for exponent in _EXPONENTS])
+
+def _exponent(value):
+    '''Power of ten (multiple of 3, -24..24) of the prefix for a non-negative value, None below 1e-24'''
+    if not value >= 1e-24:
+        return(None)
+    if value >= 1e24:
+        return(24)
+    index=int(math.log10(value)//3)+8
+    # log10 may round across a decade boundary: settle on the exact thresholds
+    if value < _THRESHOLDS[index]:
+        index-=1
+    elif value >= _THRESHOLDS[index+1]:
+        index+=1
+    return(_EXPONENTS[index])
+
+def format_value(value, unit='s', dp=2):
+    '''Format a number with an SI prefix: format_value(0.0015) -> '1.50ms'.'''
+    if value >= 0:
+        signal=''
+    else:
+        signal='-'
+    value=abs(value)
+    if unit not in ('%'):
+        exponent=_exponent(value)
+        if exponent is not None:
+            prefix,scale=PREFIXES[exponent]
+            value=value*scale
+            unit=prefix+unit
+    if dp == 2:
+        if value % 1 > 0.0000001:
+            return("{}{:.2f}{}".format(signal,float(value),unit))
+        else:
+            return("{}{}{}".format(signal,int(value),unit))
+    elif dp == 3:
+        if unit == 'mHz':
+            unit='Hz'
+            value=value/1000
+        value_str="{:.4f}".format(float(value))
+        if len(unit) == 3:
+            value_str=value_str[0:5]
+        else:
+            value_str=value_str[0:6]
+        return("{}{}{}".format(signal,value_str,unit))
+    else:
+        return("{}{}{}".format(signal,int(value),unit))
+
+def _prefix(prefix, suffix, unit, value):
+    '''SI prefix of a parsed quantity whose unit (if any) must match unit, compared case-insensitively'''
+    if unit is None or not suffix or suffix.upper() == unit.upper():
+        return(prefix)
+    # a unit starting with a prefix letter ('a', 'm'...) is not prefixed
+    if (prefix+suffix).upper() == unit.upper():
+        return('')
+    raise ValueError("Invalid unit in {!r} -> Use: {}".format(value, unit))
+
+def parse_value(value, unit=None):
+    '''Parse a number with an optional SI prefix and unit: parse_value('1.5mS', 's') -> 0.0015. Any other unit than unit raises ValueError.'''
+    match=_QUANTITY.match(value)
+    if match is None:
+        raise ValueError("Invalid quantity: {!r}".format(value))
+    number,prefix,suffix=match.groups()
+    return(float(number)*MULTIPLIERS.get(_prefix(prefix,suffix,unit,value),1.0))
+
+def _text(strings, shape):
+    '''Array of strings with the given shape'''
+    return(np.array(strings, dtype=str).reshape(shape))
+
+def format_values(values, unit='s', dp=2):
+    '''Vectorized format_value over an array of numbers, returning an array of strings'''
+    values=np.asarray(values, dtype=float)
+    signal=np.where(values >= 0, '', '-')
+    values=np.abs(values)
+    if unit in ('%'):
+        units=np.full(values.shape, unit)
+    else:
+        # index of the largest threshold <= value, -1 below 1e-24 (and for NaN)
+        index=np.searchsorted(_THRESHOLDS, values, side='right')-1
+        index=np.where(np.isnan(values), -1, index)
+        prefixed=index >= 0
+        index=np.maximum(index,0)
+        values=np.where(prefixed, values*_SCALE_BY_INDEX[index], values)
+        units=np.char.add(np.where(prefixed, _PREFIX_BY_INDEX[index], ''), unit)
+    # the digits are formatted per element (np.char.mod is slower than a comprehension); prefixes and units stay vectorized
+    if dp == 2:
+        fraction=(values % 1 > 0.0000001).ravel().tolist()
+        text=_text(["{:.2f}".format(value) if fraction[i] else "{}".format(int(value)) for i,value in enumerate(values.ravel().tolist())], values.shape)
+    elif dp == 3:
+        milli=units == 'mHz'
+        units=np.where(milli, 'Hz', units)
+        values=np.where(milli, values/1000, values)
+        text=_text(["{:.4f}".format(value) for value in values.ravel().tolist()], values.shape)
+        text=np.where(np.char.str_len(units) == 3, text.astype('U5'), text.astype('U6'))
+    else:
+        text=_text(["{}".format(int(value)) for value in values.ravel().tolist()], values.shape)
+    return(np.char.add(np.char.add(signal, text), units))
+
+class _Multipliers(dict):
+    '''Multiplier for each distinct text after the number, parsed and checked against unit on first use'''
+    def __init__(self, unit):
+        dict.__init__(self)
+        self.unit=unit
+
+    def __missing__(self, tail):
+        match=_SUFFIX.match(tail)
+        if match is None:
+            raise ValueError("Invalid quantity suffix: {!r}".format(tail))
+        prefix,suffix=match.groups()
+        multiplier=MULTIPLIERS.get(_prefix(prefix,suffix,self.unit,tail),1.0)
+        self[tail]=multiplier
+        return(multiplier)
+
+def parse_values(values, unit=None):
+    '''Vectorized parse_value over a sequence of strings, returning a float array'''
+    values=list(values)
+    # numbers convert in one np.array call; prefixes and units are parsed once per distinct suffix, not per value
+    numbers=[value.rstrip(_TAIL) for value in values]
+    try:
+        result=np.array(numbers, dtype=float)
+    except ValueError:
+        raise ValueError("Invalid quantity among {} values".format(len(values)))
+    multipliers=_Multipliers(unit)
+    return(result*np.array([multipliers[value[len(number):]] for value,number in zip(values,numbers)], dtype=float))